@@ -0,0 +1,256 @@
+"""Benchmarks the BusyBee phases against the in-process fake okapi.
+
+Usage: python -m benchmarks.bench [--backend-modules N] [--latency PATTERN=SECONDS ...]
+                                   [--error-rate PATTERN=RATE ...] [--json FILE] [--baseline FILE]
+
+Every phase drives the real BusyBee methods end to end and reports wall
+time, the number of requests okapi received and the peak memory allocated
+by python during the phase. --json saves the results, --baseline compares
+them with a saved run and fails when a phase got slower than allowed."""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+from .fake_okapi import FakeOkapi, generate_platform
+
+DEFAULT_LATENCY = {
+    r"^POST /_/proxy/tenants/[^/]+/install": 0.05,
+}
+
+
+def parse_pairs(values, value_type):
+    pairs = {}
+    for value in values or []:
+        pattern, _, number = value.rpartition("=")
+        if not pattern:
+            raise argparse.ArgumentTypeError(f"expected PATTERN=VALUE, got {value}")
+        pairs[pattern] = value_type(number)
+    return pairs
+
+
+def write_environment(home, okapi_url, install_json, backend_names, ui_names, config_overrides):
+    busybee_home = os.path.join(home, ".busybee")
+    os.makedirs(busybee_home, exist_ok=True)
+    install_json_path = os.path.join(home, "install.json")
+    with open(install_json_path, "w") as json_file:
+        json.dump(install_json, json_file)
+
+    config = {
+        "okapi-url": okapi_url,
+        "registry-url": f"{okapi_url}/registry",
+        "install-json-path": install_json_path,
+        "env-vars": {f"BENCH_VAR_{number}": f"value-{number}" for number in range(20)},
+        "be-modules": backend_names,
+        "ui-modules": ui_names,
+    }
+    config.update(config_overrides)
+    with open(os.path.join(busybee_home, "config.yml"), "w") as yaml_file:
+        yaml.safe_dump(config, yaml_file)
+    return install_json_path
+
+
+class Recorder:
+    def __init__(self, okapi):
+        self.okapi = okapi
+        self.results = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        requests_before = self.okapi.request_count
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        error = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                yield
+            except Exception as e:
+                error = str(e)
+        wall_time = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        self.results.append(
+            {
+                "phase": name,
+                "seconds": round(wall_time, 4),
+                "requests": self.okapi.request_count - requests_before,
+                "peak_kib": round(peak / 1024, 1),
+                "error": error,
+            }
+        )
+
+
+def run(args):
+    install_json, descriptors = generate_platform(args.backend_modules, args.ui_modules, args.permissions)
+    latency = dict(DEFAULT_LATENCY, **parse_pairs(args.latency, float))
+    okapi = FakeOkapi(
+        descriptors,
+        latency=latency,
+        error_rates=parse_pairs(args.error_rate, float),
+        default_latency=args.default_latency,
+        permissions=args.permissions,
+        boot_time=args.boot_time,
+    ).start()
+
+    home = tempfile.mkdtemp(prefix="busybee-bench-")
+    os.environ["HOME"] = home
+    names = [module["name"] for module in descriptors.values()]
+    backend_names = [name for name in names if name.startswith("mod-")]
+    ui_names = [name for name in names if not name.startswith("mod-")]
+    install_json_path = write_environment(
+        home, okapi.url, install_json, backend_names, ui_names, parse_config(args.config)
+    )
+
+    # busybee resolves its home directory on import, so import it only now
+    from busybee.service import BusyBee
+
+    # busybee imports requests on its first call, which is not what the phases measure
+    import requests  # noqa: F401
+
+    recorder = Recorder(okapi)
+    tracemalloc.start()
+    busybee = None
+    with recorder.phase("descriptors (cold cache)"):
+        busybee = BusyBee()
+    if busybee is None:
+        raise SystemExit(f"could not start BusyBee: {recorder.results[-1]['error']}")
+    with recorder.phase("reload (no changes)"):
+        busybee.reload()
+
+    bumped = [dict(entry) for entry in install_json]
+    bumped[-1]["id"] = bumped[-1]["id"].replace("-1.0.0", "-1.0.1")
+    okapi.descriptors[bumped[-1]["id"]] = dict(descriptors[install_json[-1]["id"]], id=bumped[-1]["id"])
+    with open(install_json_path, "w") as json_file:
+        json.dump(bumped, json_file)
+    with recorder.phase("reload (one module bumped)"):
+        busybee.reload()
+
+    with recorder.phase("env"):
+        busybee.set_module_env_vars()
+    with recorder.phase("register"):
+        busybee.register_modules()
+    with recorder.phase("create tenant"):
+        busybee.create_tenant()
+    with recorder.phase("enable"):
+        busybee.enable_modules_for_tenant()
+    with recorder.phase("admin"):
+        busybee.create_tenant_admin()
+    with recorder.phase("deploy"):
+        busybee.deploy_modules(backend_names[: args.deploy_modules])
+    with recorder.phase("redirect"):
+        for name in backend_names[: args.deploy_modules]:
+            busybee.add_redirect(name, "http://localhost:8081")
+            busybee.remove_redirect(name)
+    with recorder.phase("plan (up to date)"):
+        busybee.plan()
+    with recorder.phase("start (warm)"):
+        busybee.set_module_env_vars()
+        busybee.register_modules()
+        busybee.create_tenant()
+        busybee.enable_modules_for_tenant()
+        busybee.create_tenant_admin()
+    with recorder.phase("delete tenant"):
+        busybee.delete_tenant(busybee.tenant["id"])
+
+    # the phases above install synchronously unless --config asks otherwise,
+    # this one always goes through okapi install jobs
+    enable_settings = busybee._config.get("enable-modules") or {}
+    busybee._config["enable-modules"] = dict(enable_settings, **{"async": True, "poll-interval": 0.05})
+    with recorder.phase("enable (async)"):
+        busybee.create_tenant("bench_async", "bench_async", "install jobs")
+        busybee.enable_modules_for_tenant("bench_async")
+        busybee.delete_tenant("bench_async")
+    busybee._config["enable-modules"] = enable_settings
+
+    tracemalloc.stop()
+    okapi.stop()
+    return recorder.results, okapi.error_count
+
+
+def parse_config(values):
+    overrides = {}
+    for value in values or []:
+        key, _, raw = value.partition("=")
+        overrides[key] = yaml.safe_load(raw)
+    return overrides
+
+
+def print_results(results, baseline=None):
+    baseline_by_phase = {result["phase"]: result for result in (baseline or [])}
+    header = f"{'phase':<28} {'seconds':>9} {'requests':>9} {'peak KiB':>10}"
+    if baseline:
+        header += f" {'baseline':>9} {'change':>8}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        line = f"{result['phase']:<28} {result['seconds']:>9.3f} {result['requests']:>9} {result['peak_kib']:>10.1f}"
+        previous = baseline_by_phase.get(result["phase"])
+        if previous:
+            change = (result["seconds"] - previous["seconds"]) / max(previous["seconds"], 1e-9)
+            line += f" {previous['seconds']:>9.3f} {change:>+8.0%}"
+        if result["error"]:
+            line += f"  ERROR: {result['error']}"
+        print(line)
+
+
+def regressions(results, baseline, max_regression, min_seconds=0.05):
+    baseline_by_phase = {result["phase"]: result for result in baseline}
+    slower = []
+    for result in results:
+        previous = baseline_by_phase.get(result["phase"])
+        if previous is None or max(result["seconds"], previous["seconds"]) < min_seconds:
+            continue
+        if result["seconds"] > previous["seconds"] * (1 + max_regression):
+            slower.append(result["phase"])
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench", description=__doc__.splitlines()[0])
+    parser.add_argument("--backend-modules", type=int, default=30, help="number of backend modules")
+    parser.add_argument("--ui-modules", type=int, default=10, help="number of ui modules")
+    parser.add_argument("--permissions", type=int, default=500, help="number of permissions in mod-permissions")
+    parser.add_argument("--deploy-modules", type=int, default=5, help="number of modules deployed and redirected")
+    parser.add_argument("--boot-time", type=float, default=0.0, help="seconds deployed instances take to become healthy")
+    parser.add_argument("--default-latency", type=float, default=0.002, help="seconds added to every request")
+    parser.add_argument(
+        "--latency", action="append", help="PATTERN=SECONDS, latency of requests matching 'METHOD /path'"
+    )
+    parser.add_argument(
+        "--error-rate", action="append", help="PATTERN=RATE, share of requests matching 'METHOD /path' answered with 503"
+    )
+    parser.add_argument("--config", action="append", help="KEY=YAML, override a config.yml setting")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with results saved by --json")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    results, injected_errors = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as json_file:
+            baseline = json.load(json_file)["results"]
+
+    print_results(results, baseline)
+    if injected_errors:
+        print(f"\n{injected_errors} injected errors")
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
+
+    failed = [result["phase"] for result in results if result["error"]]
+    slower = regressions(results, baseline, args.max_regression) if baseline else []
+    if slower:
+        print(f"\nslower than the baseline: {', '.join(slower)}")
+    return 1 if failed or slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
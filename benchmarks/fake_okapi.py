@@ -0,0 +1,425 @@
+"""In-process fake of the okapi and FOLIO registry endpoints busybee calls.
+
+The server keeps okapi state (env, registered modules, tenants, discovery,
+users and permissions) in memory, serves registry descriptors under
+/registry and can add latency or errors to any endpoint, which is enough to
+drive the real BusyBee methods end to end."""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+MODULE_NAME_PATTERN = re.compile(r"^([\w-]*)\-\d+.\d+[.\d+]*.*")
+
+# modules create_tenant_admin and the permission lookups depend on
+CORE_MODULES = [
+    ("mod-permissions", "permissions", []),
+    ("mod-users", "users", ["permissions"]),
+    ("mod-login", "login", ["users"]),
+    ("mod-authtoken", "authtoken", ["permissions"]),
+]
+
+
+def module_name(module_id):
+    match = MODULE_NAME_PATTERN.search(module_id)
+    return match.group(1) if match else module_id
+
+
+def generate_platform(backend_modules=30, ui_modules=10, permissions=200):
+    """Returns (install_json, descriptors) of a synthetic platform.
+
+    Every generated backend module provides one interface and requires the
+    interfaces of up to two earlier modules, so the dependency graph has
+    several levels."""
+    descriptors = {}
+
+    def add(name, provides, requires, backend=True):
+        module_id = f"{name}-1.0.0"
+        descriptor = {
+            "id": module_id,
+            "name": name,
+            "provides": [{"id": interface, "version": "1.0"} for interface in provides],
+            "requires": [{"id": interface, "version": "1.0"} for interface in requires],
+            "permissionSets": [
+                {"permissionName": f"{name}.perm.{number}", "displayName": f"{name} permission {number}"}
+                for number in range(permissions // max(1, backend_modules))
+            ],
+        }
+        if backend:
+            descriptor["launchDescriptor"] = {
+                "dockerImage": f"folioorg/{name}:1.0.0",
+                "dockerArgs": {"HostConfig": {"Memory": 536870912, "PortBindings": {"8081/tcp": [{"HostPort": "%p"}]}}},
+                "env": [{"name": "JAVA_OPTIONS", "value": "-XX:MaxRAMPercentage=66.0"}],
+            }
+        descriptors[module_id] = descriptor
+
+    for name, interface, requires in CORE_MODULES:
+        add(name, [interface], requires)
+    for number in range(max(0, backend_modules - len(CORE_MODULES))):
+        requires = ["users"] + [f"bench-{earlier}" for earlier in {number - 1, number // 2} if 0 <= earlier < number]
+        add(f"mod-bench-{number:02d}", [f"bench-{number}"], requires)
+    for number in range(ui_modules):
+        add(f"folio_bench-{number:02d}", [], ["users"], backend=False)
+
+    install_json = [{"id": module_id, "action": "enable"} for module_id in descriptors]
+    return install_json, descriptors
+
+
+class FakeOkapi:
+    """Threaded HTTP server emulating okapi and the registry.
+
+    latency and error_rates map regular expressions, matched against
+    "METHOD /path", to seconds of added latency and to the probability of
+    answering 503."""
+
+    def __init__(
+        self,
+        descriptors,
+        latency=None,
+        error_rates=None,
+        default_latency=0.0,
+        permissions=200,
+        install_job_polls=2,
+        nodes=("localhost",),
+        boot_time=0.0,
+    ):
+        self.descriptors = descriptors
+        self.latency = [(re.compile(pattern), seconds) for pattern, seconds in (latency or {}).items()]
+        self.error_rates = [(re.compile(pattern), rate) for pattern, rate in (error_rates or {}).items()]
+        self.default_latency = default_latency
+        self.install_job_polls = install_job_polls
+        self.nodes = list(nodes)
+        self.boot_time = boot_time
+        self.started = {}
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+
+        self.env = {}
+        self.modules = {"okapi-5.0.0": {"id": "okapi-5.0.0", "name": "okapi", "provides": []}}
+        self.tenants = {"supertenant": {"id": "supertenant", "modules": ["okapi-5.0.0"]}}
+        self.discovery = []
+        self.jobs = {}
+        self.users = {}
+        self.credentials = set()
+        self.permission_users = {}
+        self.permissions = [
+            {"permissionName": f"bench.all.{number}", "childOf": [], "subPermissions": []}
+            for number in range(permissions)
+        ]
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(FakeOkapiHandler):
+            okapi = fake
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def delay_and_fault(self, target):
+        delay = self.default_latency
+        for pattern, seconds in self.latency:
+            if pattern.search(target):
+                delay = seconds
+                break
+        if delay:
+            time.sleep(delay)
+        for pattern, rate in self.error_rates:
+            if pattern.search(target) and random.random() < rate:
+                return True
+        return False
+
+    def interface_providers(self, tenant_id, interface):
+        enabled = self.tenants[tenant_id]["modules"]
+        return [
+            {"id": module_id}
+            for module_id in enabled
+            if any(provided["id"] == interface for provided in self.modules.get(module_id, {}).get("provides", []))
+        ]
+
+    def install(self, tenant_id, entries, deploy):
+        modules = self.tenants[tenant_id]["modules"]
+        result = []
+        for entry in entries:
+            module_id = entry["id"]
+            if module_id not in self.modules:
+                raise KeyError(module_id)
+            name = module_name(module_id)
+            modules[:] = [enabled for enabled in modules if module_name(enabled) != name]
+            if entry.get("action", "enable") == "enable":
+                modules.append(module_id)
+                if deploy and "launchDescriptor" in self.modules[module_id]:
+                    self.deploy(module_id, None)
+            result.append({"id": module_id, "action": entry.get("action", "enable")})
+        return result
+
+    def deploy(self, module_id, node_id, inst_id=None, url=None):
+        # install deploys a module only when it has no instance, redirects replace their instance id
+        for instance in self.discovery:
+            if instance["srvcId"] == module_id and (instance["instId"] == inst_id or (node_id is url is inst_id is None)):
+                return instance
+        instance = {"srvcId": module_id, "instId": inst_id or str(uuid.uuid4())}
+        if url is None:
+            node_id = node_id or self.nodes[0]
+            instance["nodeId"] = node_id
+            url = f"http://{node_id}:{9131 + len(self.discovery)}"
+        instance["url"] = url
+        self.discovery.append(instance)
+        self.started[instance["instId"]] = time.monotonic()
+        return instance
+
+
+class FakeOkapiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, don't let them wait for delayed ACKs
+    disable_nagle_algorithm = True
+    okapi = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def send(self, status, body=None, headers=None):
+        if body is None:
+            data = b""
+        elif isinstance(body, str):
+            data = body.encode()
+        else:
+            data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/plain" if isinstance(body, str) else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def dispatch(self, method):
+        okapi = self.okapi
+        url = urlparse(self.path)
+        path = unquote(url.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+
+        with okapi.lock:
+            okapi.request_count += 1
+        if okapi.delay_and_fault(f"{method} {path}"):
+            with okapi.lock:
+                okapi.error_count += 1
+            return self.send(503, "injected failure")
+
+        with okapi.lock:
+            try:
+                status, response, headers = self.route(method, path, query, body)
+            except KeyError as e:
+                status, response, headers = 404, f"not found: {e}", None
+        self.send(status, response, headers)
+
+    def route(self, method, path, query, body):
+        okapi = self.okapi
+        tenant_header = self.headers.get("X-Okapi-Tenant")
+
+        if path.startswith("/registry/_/proxy/modules/"):
+            return 200, okapi.descriptors[path.rsplit("/", 1)[1]], None
+
+        if path == "/_/env":
+            if method == "GET":
+                return 200, [{"name": name, "value": value} for name, value in okapi.env.items()], None
+            okapi.env[body["name"]] = body["value"]
+            return 201, body, None
+        if path.startswith("/_/env/"):
+            del okapi.env[path.rsplit("/", 1)[1]]
+            return 204, None, None
+
+        if path == "/_/proxy/modules":
+            if method == "GET":
+                name_filter = query.get("filter", "")
+                return 200, [{"id": module_id} for module_id in okapi.modules if name_filter in module_id], None
+            okapi.modules[body["id"]] = body
+            return 201, body, None
+        if path.startswith("/_/proxy/modules/"):
+            return 200, okapi.modules[path.rsplit("/", 1)[1]], None
+
+        if path == "/_/proxy/tenants":
+            if method == "GET":
+                return 200, [{"id": tenant_id} for tenant_id in okapi.tenants], None
+            if body["id"] in okapi.tenants:
+                return 400, f"Duplicate tenant id {body['id']}", None
+            okapi.tenants[body["id"]] = {"id": body["id"], "modules": []}
+            return 201, body, None
+
+        match = re.match(r"^/_/proxy/tenants/([^/]+)(/.*)?$", path)
+        if match:
+            return self.route_tenant(method, match.group(1), match.group(2) or "", query, body)
+
+        if path.startswith("/_/discovery"):
+            return self.route_discovery(method, path, body)
+
+        return self.route_tenant_api(method, path, query, body, tenant_header)
+
+    def route_tenant(self, method, tenant_id, rest, query, body):
+        okapi = self.okapi
+        tenant = okapi.tenants[tenant_id]
+        if rest == "":
+            if method == "DELETE":
+                del okapi.tenants[tenant_id]
+                return 204, None, None
+            return 200, {"id": tenant_id}, None
+        if rest == "/modules":
+            if method == "GET":
+                return 200, [{"id": module_id} for module_id in tenant["modules"]], None
+            module_id = body["id"]
+            if module_id == "okapi":
+                module_id = "okapi-5.0.0"
+            okapi.install(tenant_id, [{"id": module_id, "action": "enable"}], False)
+            return 201, body, None
+        if rest.startswith("/modules/"):
+            module_id = rest.split("/")[2]
+            if module_id not in tenant["modules"]:
+                return 404, f"module {module_id} is not enabled", None
+            if method == "DELETE":
+                tenant["modules"].remove(module_id)
+                return 204, None, None
+            return 200, {"id": module_id}, None
+        if rest.startswith("/interfaces/"):
+            return 200, okapi.interface_providers(tenant_id, rest.split("/")[2]), None
+        if rest == "/install":
+            result = okapi.install(tenant_id, body, query.get("deploy") == "true")
+            if query.get("async") == "true":
+                job_id = str(uuid.uuid4())
+                okapi.jobs[job_id] = {
+                    "id": job_id,
+                    "complete": False,
+                    "polls": 0,
+                    "modules": [dict(entry, stage="pending") for entry in result],
+                }
+                return 201, self.job_view(job_id), {"Location": f"/_/proxy/tenants/{tenant_id}/install/{job_id}"}
+            return 200, result, None
+        if rest.startswith("/install/"):
+            job_id = rest.split("/")[2]
+            job = okapi.jobs[job_id]
+            job["polls"] += 1
+            if job["polls"] >= okapi.install_job_polls:
+                job["complete"] = True
+                for entry in job["modules"]:
+                    entry["stage"] = "done"
+            else:
+                for entry in job["modules"]:
+                    entry["stage"] = "invoke"
+            return 200, self.job_view(job_id), None
+        raise KeyError(rest)
+
+    def job_view(self, job_id):
+        return {key: value for key, value in self.okapi.jobs[job_id].items() if key != "polls"}
+
+    def route_discovery(self, method, path, body):
+        okapi = self.okapi
+        if path == "/_/discovery/nodes":
+            return 200, [{"nodeId": node, "url": f"http://{node}:9130"} for node in okapi.nodes], None
+        if path == "/_/discovery/modules":
+            if method == "GET":
+                return 200, okapi.discovery, None
+            instance = okapi.deploy(body["srvcId"], body.get("nodeId"), body.get("instId"), body.get("url"))
+            return 201, instance, None
+        if path == "/_/discovery/health":
+            return 200, [self.health(instance) for instance in okapi.discovery], None
+        match = re.match(r"^/_/discovery/(modules|health)/([^/]+)(?:/(.+))?$", path)
+        if match:
+            kind, srvc_id, inst_id = match.groups()
+            instances = [
+                instance
+                for instance in okapi.discovery
+                if instance["srvcId"] == srvc_id and (inst_id is None or instance["instId"] == inst_id)
+            ]
+            if not instances:
+                return 404, f"{srvc_id} is not deployed", None
+            if kind == "health":
+                if inst_id is not None:
+                    return 200, self.health(instances[0]), None
+                return 200, [self.health(instance) for instance in instances], None
+            if method == "DELETE":
+                okapi.discovery[:] = [instance for instance in okapi.discovery if instance not in instances]
+                return 204, None, None
+            return 200, instances, None
+        raise KeyError(path)
+
+    def health(self, instance):
+        # instances answer once they had boot_time seconds to start
+        ready = time.monotonic() - self.okapi.started.get(instance["instId"], 0) >= self.okapi.boot_time
+        return {
+            "srvcId": instance["srvcId"],
+            "instId": instance["instId"],
+            "healthStatus": ready,
+            "healthMessage": "OK" if ready else "Fail: Connection refused",
+        }
+
+    def route_tenant_api(self, method, path, query, body, tenant_id):
+        okapi = self.okapi
+        if path == "/users":
+            if method == "GET":
+                username = query["query"].split("==")[1]
+                users = [user for user in okapi.users.values() if user["username"] == username]
+                return 200, {"users": users, "totalRecords": len(users)}, None
+            okapi.users[body["id"]] = body
+            return 201, body, None
+        if path == "/authn/credentials-existence":
+            return 200, {"credentialsExist": query["userId"] in okapi.credentials}, None
+        if path == "/authn/credentials":
+            okapi.credentials.add(body["userId"])
+            return 201, {}, None
+        if path == "/perms/permissions":
+            # mod-permissions pages with a 1-based start and length, not offset and limit
+            start = int(query.get("start", 1)) - 1
+            length = int(query.get("length", 10))
+            page = okapi.permissions[start:start + length]
+            return 200, {"permissions": page, "totalRecords": len(okapi.permissions)}, None
+        if path == "/perms/users":
+            if method == "GET":
+                user_id = query["query"].split("==")[1]
+                records = [record for record in okapi.permission_users.values() if record["userId"] == user_id]
+                return 200, {"permissionUsers": records, "totalRecords": len(records)}, None
+            record = dict(body, id=str(uuid.uuid4()))
+            okapi.permission_users[record["id"]] = record
+            return 201, record, None
+        match = re.match(r"^/perms/users/([^/]+)(/permissions)?$", path)
+        if match:
+            record = okapi.permission_users[match.group(1)]
+            if match.group(2):
+                record["permissions"].append(body["permissionName"])
+                return 200, body, None
+            if method == "PUT":
+                okapi.permission_users[record["id"]] = dict(body, id=record["id"])
+                return 204, None, None
+            return 200, record, None
+        if path == "/service-points-users":
+            return 200, {"servicePointsUsers": [], "totalRecords": 0}, None
+        raise KeyError(path)
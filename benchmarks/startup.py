@@ -0,0 +1,119 @@
+"""Measures how long the busybee shell takes to start.
+
+Usage: python -m benchmarks.startup [--modules N] [--runs N] [--exe dist/busybee]
+                                     [--json FILE] [--baseline FILE]
+
+Every run starts busybee in a fresh process with a descriptor cache of
+--modules modules and reports the time until the prompt is ready and
+until a command needing the module descriptors has answered. By default
+the source tree is started with python -m busybee, --exe starts a frozen
+build from build.py instead. --json saves the results, --baseline
+compares them with a saved run and fails when startup got slower than
+allowed."""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from busybee.cache import DescriptorCache
+from .bench import regressions, write_environment
+from .fake_okapi import generate_platform
+
+READY_LINE = "Ready for your commands!"
+# last line printed by the resources command, which needs every descriptor
+DESCRIPTORS_LINE = "total memory:"
+
+
+def write_cache(home, descriptors):
+    cache = DescriptorCache(os.path.join(home, ".busybee", ".descriptor-cache"))
+    cache.save({descriptor["name"]: {"id": module_id, "desc": descriptor} for module_id, descriptor in descriptors.items()})
+
+
+def start_once(command, env):
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+    )
+    ready = descriptors = None
+    output = []
+    for line in process.stdout:
+        output.append(line)
+        if ready is None and READY_LINE in line:
+            ready = time.perf_counter() - start
+            process.stdin.write("resources\nquit\n")
+            process.stdin.flush()
+        elif DESCRIPTORS_LINE in line:
+            descriptors = time.perf_counter() - start
+    process.wait()
+    if ready is None or descriptors is None:
+        raise SystemExit(f"busybee did not start:\n{''.join(output)}")
+    return ready, descriptors
+
+
+def run(args):
+    install_json, descriptors = generate_platform(args.modules, 0, 0)
+    home = tempfile.mkdtemp(prefix="busybee-startup-")
+    names = [descriptor["name"] for descriptor in descriptors.values()]
+    # nothing listens there, startup must not need okapi
+    write_environment(home, "http://127.0.0.1:9", install_json, names, [], {})
+    write_cache(home, descriptors)
+
+    env = dict(os.environ, HOME=home, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    command = [os.path.abspath(args.exe)] if args.exe else [sys.executable, "-m", "busybee"]
+    target = "frozen" if args.exe else "source"
+
+    samples = [start_once(command, env) for _ in range(args.runs)]
+    results = []
+    for index, name in enumerate(("prompt", "descriptors")):
+        values = [sample[index] for sample in samples]
+        results.append(
+            {
+                "phase": f"{target} {name}",
+                "seconds": round(statistics.median(values), 4),
+                "min": round(min(values), 4),
+                "max": round(max(values), 4),
+            }
+        )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", type=int, default=300, help="number of modules in the descriptor cache")
+    parser.add_argument("--runs", type=int, default=5, help="number of times busybee is started")
+    parser.add_argument("--exe", help="path of a frozen busybee executable (built with build.py)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with results saved by --json")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(f"{'startup':<24} {'median s':>9} {'min s':>7} {'max s':>7}")
+    for result in results:
+        print(f"{result['phase']:<24} {result['seconds']:>9.3f} {result['min']:>7.3f} {result['max']:>7.3f}")
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
+
+    slower = []
+    if args.baseline:
+        with open(args.baseline, "r") as json_file:
+            slower = regressions(results, json.load(json_file)["results"], args.max_regression)
+    if slower:
+        print(f"\nslower than the baseline: {', '.join(slower)}")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,12 @@
+import sys
 import PyInstaller.__main__
 
+# --onedir starts faster, a --onefile executable unpacks itself on every start
+bundle_mode = '--onedir' if '--onedir' in sys.argv[1:] else '--onefile'
 
 PyInstaller.__main__.run([
     'busybee/__main__.py',
-    '--onefile',
+    bundle_mode,
     '--name=busybee',
     '--add-data=config.yml:.',
     '--noconfirm'
@@ -1,6 +1,13 @@
-from busybee.cli import BusyBeeCli
 import sys
 
 if __name__ == "__main__":
+    if sys.argv[1:2] in (["run"], ["start"]):
+        # scripted runs skip the interactive shell, and the time it takes to import it
+        from busybee.batch import main
+
+        sys.exit(main(sys.argv[1:]))
+
+    from busybee.cli import BusyBeeCli
+
     app = BusyBeeCli()
-    sys.exit(app.cmdloop())
\ No newline at end of file
+    sys.exit(app.cmdloop())
@@ -0,0 +1,425 @@
+"""Runs busybee operations without the interactive shell, for scripts and CI.
+
+Usage: busybee run PLAN_FILE [-j JOBS] [-o FILE]
+       busybee start [--tenant TENANT_ID] [--profile PROFILE] [--resume | --fresh] [-o FILE]
+
+A plan file lists steps, each running one operation. A step starts as soon
+as the steps it needs are done, so independent steps run at the same time:
+
+    jobs: 4
+    steps:
+      - run: register
+      - name: tenant-a
+        run: create_tenant
+        with: {tenant: a, profile: minimal}
+        needs: register
+      - name: redirect-users
+        run: redirect
+        with: {module: mod-users, location: "http://10.0.0.5:8081"}
+
+A JSON report of every step (status, seconds, result, output) is written to
+stdout, everything else goes to stderr. The exit code is 0 when every step
+is done, 1 when a step failed or was skipped, 2 when the plan or the
+configuration is invalid and 130 when the run was interrupted."""
+
+import argparse
+import inspect
+import json
+import queue
+import signal as os_signal
+import sys
+import time
+from blinker import signal
+from .config import MissingConfigurationException
+from .jobs import JobManager, JobOutput
+from .journal import Journal, fingerprint
+from .graph import DependencyCycleException, topological_levels
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INVALID = 2
+EXIT_INTERRUPTED = 130
+
+
+class PlanException(Exception):
+    def __init__(self, message="Invalid plan file"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class StepException(Exception):
+    """Failure of a step that still has a result worth reporting"""
+
+    def __init__(self, message="Step failed", result=None):
+        self.message = message
+        self.result = result
+        super().__init__(self.message)
+
+
+def run_journal(journal, steps):
+    """Runs the (name, fn) steps of a journaled command, returns whether all of them are done"""
+    for step, fn in steps:
+        if not journal.run(step, fn):
+            return False
+    journal.finish()
+    return True
+
+
+def start_journal(busybee, tenant_id=None, profile=None, resume=False, fresh=False):
+    name = f"start-{tenant_id}" if tenant_id else "start"
+    args = {"config": fingerprint(busybee._config)}
+    if tenant_id or profile:
+        args.update(tenant=tenant_id, profile=profile)
+    journal = Journal(name, args, resume=resume, fresh=fresh)
+    steps = [
+        ("env", busybee.set_module_env_vars),
+        ("register", busybee.register_modules),
+        ("tenant", lambda: busybee.create_tenant(tenant_id)),
+        ("enable", lambda: busybee.enable_modules_for_tenant(tenant_id, profile=profile)),
+        ("admin", lambda: busybee.create_tenant_admin(tenant_id)),
+    ]
+    return journal, steps
+
+
+def create_tenant_journal(
+    busybee, tenant_id, name=None, description=None, include=(), exclude=(), profile=None, resume=False, fresh=False
+):
+    journal = Journal(
+        f"create_tenant-{tenant_id}",
+        {
+            "config": fingerprint(busybee._config),
+            "include": list(include),
+            "exclude": list(exclude),
+            "profile": profile,
+        },
+        resume=resume,
+        fresh=fresh,
+    )
+    steps = [
+        ("tenant", lambda: busybee.create_tenant(tenant_id, name, description)),
+        ("enable", lambda: busybee.enable_modules_for_tenant(tenant_id, list(include), list(exclude), profile=profile)),
+        ("admin", lambda: busybee.create_tenant_admin(tenant_id)),
+    ]
+    return journal, steps
+
+
+def _names(value):
+    """Module or tenant names given as a list or a comma separated string"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def _tenant_results(results):
+    failed = [result["tenant"] for result in results if result["error"] is not None]
+    if failed:
+        raise StepException(f"{len(failed)} of {len(results)} tenants failed: {', '.join(failed)}", results)
+    return results
+
+
+def _failed_modules(action, failed):
+    if failed:
+        raise StepException(f"could not {action} {', '.join(failed)}", failed)
+
+
+def start(busybee, tenant=None, profile=None, resume=False, fresh=False):
+    if not run_journal(*start_journal(busybee, tenant, profile, resume, fresh)):
+        raise Exception("start stopped at a failed step, run it again with resume")
+
+
+def create_tenant(
+    busybee, tenant, name=None, description=None, include_modules=None, exclude_modules=None, profile=None, resume=False, fresh=False
+):
+    journal, steps = create_tenant_journal(
+        busybee, tenant, name, description, _names(include_modules), _names(exclude_modules), profile, resume, fresh
+    )
+    if not run_journal(journal, steps):
+        raise Exception(f"create_tenant {tenant} stopped at a failed step, run it again with resume")
+
+
+def delete_tenant(busybee, tenant):
+    if not busybee.delete_tenant(tenant):
+        raise Exception(f"could not delete tenant({tenant})")
+
+
+def create_tenants(busybee, tenants, include_modules=None, exclude_modules=None, profile=None, workers=None):
+    return _tenant_results(
+        busybee.create_tenants(
+            _names(tenants), _names(include_modules), _names(exclude_modules), profile=profile, workers=workers
+        )
+    )
+
+
+def delete_tenants(busybee, tenants, workers=None):
+    return _tenant_results(busybee.delete_tenants(_names(tenants), workers=workers))
+
+
+def deploy(busybee, modules):
+    _failed_modules("deploy", busybee.deploy_modules(_names(modules)))
+
+
+def undeploy(busybee, module):
+    if not busybee.undeploy_module(module):
+        raise Exception(f"could not undeploy {module}")
+
+
+def redirect(busybee, module, location=None, remove=False):
+    if remove:
+        if not busybee.remove_redirect(module):
+            raise Exception(f"could not remove the redirect of {module}")
+        return
+    if location is None:
+        raise Exception("redirect needs a location, or remove: true")
+    busybee.remove_redirect(module)
+    if not busybee.add_redirect(module, location):
+        raise Exception(f"could not redirect {module} to {location}")
+
+
+def upgrade(busybee, modules=None):
+    _failed_modules("upgrade", busybee.upgrade_modules(_names(modules) or None))
+
+
+def redeploy(busybee, modules):
+    _failed_modules("redeploy", busybee.redeploy_modules(_names(modules)))
+
+
+def health(busybee):
+    report = busybee.health()
+    unhealthy = [instance["instId"] for instance in report if not instance["healthStatus"]]
+    if unhealthy:
+        raise StepException(f"{len(unhealthy)} of {len(report)} instances are not healthy", report)
+    return report
+
+
+def plan(busybee, tenant=None):
+    return list(busybee.plan(tenant).describe())
+
+
+def apply(busybee, tenant=None):
+    if busybee.apply(tenant) is False:
+        raise Exception(f"apply stopped, tenant({tenant or busybee.tenant['id']}) could not be created")
+
+
+def reload(busybee):
+    busybee.reload()
+
+
+OPERATIONS = {
+    "start": start,
+    "env": lambda busybee: busybee.set_module_env_vars(),
+    "register": lambda busybee: busybee.register_modules(),
+    "create_tenant": create_tenant,
+    "delete_tenant": delete_tenant,
+    "create_tenants": create_tenants,
+    "delete_tenants": delete_tenants,
+    "deploy": deploy,
+    "undeploy": undeploy,
+    "redirect": redirect,
+    "upgrade": upgrade,
+    "redeploy": redeploy,
+    "health": health,
+    "plan": plan,
+    "apply": apply,
+    "reload": reload,
+}
+
+
+def load_plan(path):
+    """Reads and checks a plan file. Returns {"jobs", "steps"} with every step
+    as {"name", "run", "with", "needs"}. Raises PlanException."""
+    import yaml
+
+    try:
+        with open(path, "r") as plan_file:
+            content = yaml.safe_load(plan_file) or {}
+    except (IOError, yaml.YAMLError) as e:
+        raise PlanException(f"could not read plan {path}: {e}")
+    if not isinstance(content, dict) or not isinstance(content.get("steps"), list) or not content["steps"]:
+        raise PlanException(f"plan {path} has no steps list")
+    return {"jobs": content.get("jobs"), "steps": check_steps(content["steps"])}
+
+
+def check_steps(items):
+    steps = []
+    for number, item in enumerate(items, start=1):
+        if not isinstance(item, dict) or item.get("run") not in OPERATIONS:
+            raise PlanException(f"step {number} has to run one of: {', '.join(OPERATIONS)}")
+        name = str(item.get("name", item["run"]))
+        if any(step["name"] == name for step in steps):
+            raise PlanException(f"there is more than one step named {name}, give them a name")
+        args = {str(key).replace("-", "_"): value for key, value in (item.get("with") or {}).items()}
+        try:
+            inspect.signature(OPERATIONS[item["run"]]).bind(None, **args)
+        except TypeError as e:
+            raise PlanException(f"step {name}: invalid arguments for {item['run']}: {e}")
+        steps.append({"name": name, "run": item["run"], "with": args, "needs": _names(item.get("needs"))})
+
+    names = {step["name"] for step in steps}
+    for step in steps:
+        unknown = [need for need in step["needs"] if need not in names]
+        if unknown:
+            raise PlanException(f"step {step['name']} needs unknown steps: {', '.join(unknown)}")
+    try:
+        topological_levels({step["name"]: set(step["needs"]) for step in steps})
+    except DependencyCycleException as e:
+        raise PlanException(f"steps need each other: {' -> '.join(e.cycle)}")
+    return steps
+
+
+def run_steps(busybee, steps, workers):
+    """Runs every step once the steps it needs are done, independent steps at the
+    same time on workers threads. A step needing a step that did not succeed is
+    skipped. An interrupt cancels the running steps and skips the others.
+    Returns (the report of every step in plan order, whether it was interrupted)."""
+    manager = JobManager(workers)
+    finished = queue.Queue()
+    reports = {
+        step["name"]: {"name": step["name"], "run": step["run"], "status": "pending", "seconds": 0, "error": None, "result": None, "output": []}
+        for step in steps
+    }
+    pending = list(steps)
+    running = {}
+    interrupted = False
+
+    try:
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for step in list(pending):
+                    states = [reports[need]["status"] for need in step["needs"]]
+                    if all(state == "done" for state in states):
+                        job = manager.submit(
+                            step["name"],
+                            lambda step=step: OPERATIONS[step["run"]](busybee, **step["with"]),
+                            finished.put,
+                        )
+                        running[job.id] = step
+                        reports[step["name"]]["status"] = "running"
+                        print(f"[{step['name']}] started", file=sys.stderr)
+                    elif any(state in ("failed", "skipped", "cancelled") for state in states):
+                        failed_needs = [need for need in step["needs"] if reports[need]["status"] != "done"]
+                        reports[step["name"]].update(status="skipped", error=f"needs {', '.join(failed_needs)}")
+                        print(f"[{step['name']}] skipped, it needs {', '.join(failed_needs)}", file=sys.stderr)
+                        changed = True
+                    else:
+                        continue
+                    pending.remove(step)
+
+            if not running:
+                break
+            job = finished.get()
+            step = running.pop(job.id)
+            report = reports[step["name"]]
+            report.update(
+                status=job.status,
+                seconds=round(job.seconds, 3),
+                error=job.error,
+                result=job.result,
+                output="".join(text for _, text in job.output()).splitlines(),
+            )
+            if isinstance(job.exception, StepException):
+                report["result"] = job.exception.result
+            print(f"[{step['name']}] {job.status} after {job.seconds:.1f}s" + (f": {job.error}" if job.error else ""), file=sys.stderr)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        # cancels the steps still running and waits for them to stop
+        manager.shutdown()
+    for job_id, step in running.items():
+        job = manager.get(job_id)
+        reports[step["name"]].update(status=job.status, seconds=round(job.seconds, 3), error=job.error)
+    for step in pending:
+        reports[step["name"]].update(status="skipped", error="interrupted")
+    return [reports[step["name"]] for step in steps], interrupted
+
+
+def _json_value(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def _print_output(message):
+    print(message)
+
+
+def _print_error(message):
+    print(message, file=sys.stderr)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="busybee", description="Runs busybee operations without the interactive shell")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the steps of a plan file")
+    run_parser.add_argument("plan", help="YAML plan file with the steps to run")
+    run_parser.add_argument("-j", "--jobs", type=int, help="number of steps running at the same time (defaults to jobs of the plan, then job-workers)")
+    start_parser = commands.add_parser("start", help="initialize the environment and create a tenant with enabled modules")
+    start_parser.add_argument("--tenant", help="id of the tenant (defaults to the start tenant)")
+    start_parser.add_argument("--profile", help="tenant profile deciding the data loaded by each module")
+    group = start_parser.add_mutually_exclusive_group()
+    group.add_argument("--resume", action="store_true", help="skip the steps completed by the previous run")
+    group.add_argument("--fresh", action="store_true", help="discard the journal of the previous run")
+    for command_parser in (run_parser, start_parser):
+        command_parser.add_argument("-o", "--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report_stream = sys.stdout
+    # stdout is kept for the report, the output of every step goes to its report
+    sys.stdout = JobOutput(sys.stderr)
+    sys.stderr = JobOutput(sys.stderr, error=True)
+    signal("output").connect(_print_output)
+    signal("errors").connect(_print_error)
+    os_signal.signal(os_signal.SIGTERM, _interrupt)
+
+    started = time.monotonic()
+    report = {"command": args.command, "status": "invalid", "seconds": 0, "error": None, "steps": []}
+    exit_code = EXIT_INVALID
+    try:
+        if args.command == "run":
+            plan_file = load_plan(args.plan)
+            steps, workers = plan_file["steps"], args.jobs or plan_file["jobs"]
+        else:
+            options = {"tenant": args.tenant, "profile": args.profile, "resume": args.resume, "fresh": args.fresh}
+            steps, workers = check_steps([{"run": "start", "with": options}]), 1
+
+        from .service import BusyBee
+
+        try:
+            busybee = BusyBee()
+        except MissingConfigurationException:
+            raise
+        except Exception as e:
+            report.update(status="failed", error=f"could not start busybee: {e}")
+            exit_code = EXIT_FAILED
+        else:
+            report["steps"], interrupted = run_steps(busybee, steps, workers or busybee._config.get("job-workers", 4))
+            failed = [step for step in report["steps"] if step["status"] != "done"]
+            if interrupted:
+                report.update(status="interrupted", error="interrupted")
+                exit_code = EXIT_INTERRUPTED
+            else:
+                report["status"] = "failed" if failed else "done"
+                exit_code = EXIT_FAILED if failed else EXIT_OK
+    except (PlanException, MissingConfigurationException) as e:
+        report["error"] = str(e)
+    except KeyboardInterrupt:
+        report.update(status="interrupted", error="interrupted")
+        exit_code = EXIT_INTERRUPTED
+
+    report["seconds"] = round(time.monotonic() - started, 3)
+    if report["error"]:
+        print(report["error"], file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(report, json_file, indent=2, default=_json_value)
+    else:
+        json.dump(report, report_stream, indent=2, default=_json_value)
+        report_stream.write("\n")
+    return exit_code
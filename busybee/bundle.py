@@ -0,0 +1,120 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+from datetime import datetime, timezone
+
+BUNDLE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+class BundleException(Exception):
+    def __init__(self, message="Invalid descriptor bundle"):
+        self.message = message
+        super().__init__(self.message)
+
+
+def _encode(value):
+    # canonical encoding, so equal documents always get the same hash
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+
+
+def _blob_name(data):
+    return f"blobs/{hashlib.sha256(data).hexdigest()}.json"
+
+
+class Bundle:
+    """Compressed, content-addressed archive of install.json files and module descriptors.
+
+    Every document is stored once under the sha256 of its content. The
+    manifest maps platform labels to their install.json (and additional
+    modules) blobs and module ids to their descriptor blob, so descriptors
+    shared by several platform versions are only stored once."""
+
+    def __init__(self):
+        self.platforms = {}
+        self.modules = {}
+        self.blobs = {}
+
+    @classmethod
+    def read(cls, path):
+        bundle = cls()
+        try:
+            with tarfile.open(path, "r:gz") as archive:
+                members = {member.name: member for member in archive.getmembers() if member.isfile()}
+                if MANIFEST_NAME not in members:
+                    raise BundleException(f"{path} has no {MANIFEST_NAME}")
+                manifest = json.load(archive.extractfile(members[MANIFEST_NAME]))
+                if manifest.get("version") != BUNDLE_VERSION:
+                    raise BundleException(f"unsupported bundle version {manifest.get('version')} in {path}")
+                for name, member in members.items():
+                    if name.startswith("blobs/"):
+                        data = archive.extractfile(member).read()
+                        if _blob_name(data) != name:
+                            raise BundleException(f"{name} in {path} is corrupted")
+                        bundle.blobs[name] = data
+        except (tarfile.TarError, ValueError, IOError) as e:
+            raise BundleException(f"could not read bundle {path}: {e}")
+        bundle.platforms = manifest.get("platforms", {})
+        bundle.modules = manifest.get("modules", {})
+        return bundle
+
+    def write(self, path):
+        """Writes the archive next to path and moves it in place once complete"""
+        manifest = {"version": BUNDLE_VERSION, "platforms": self.platforms, "modules": self.modules}
+        tmp_path = f"{path}.tmp"
+        with tarfile.open(tmp_path, "w:gz") as archive:
+            for name, data in [(MANIFEST_NAME, json.dumps(manifest, indent=2).encode())] + sorted(self.blobs.items()):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        os.replace(tmp_path, path)
+
+    def __put(self, value):
+        data = _encode(value)
+        name = _blob_name(data)
+        self.blobs[name] = data
+        return name
+
+    def __get(self, name):
+        if name not in self.blobs:
+            raise BundleException(f"bundle is missing {name}")
+        return json.loads(self.blobs[name])
+
+    def add_platform(self, install_json, additional_json, label=None):
+        """Adds an install.json and returns its label (the install.json hash by default)"""
+        install_blob = self.__put(install_json)
+        label = label or install_blob[len("blobs/"):][:12]
+        self.platforms[label] = {
+            "install": install_blob,
+            "additional": self.__put(additional_json) if additional_json else None,
+            "created": datetime.now(timezone.utc).isoformat(),
+        }
+        return label
+
+    def add_descriptor(self, module_id, descriptor):
+        """Adds a descriptor unless the bundle already has one for module_id.
+        Returns whether it was added."""
+        if module_id in self.modules:
+            return False
+        self.modules[module_id] = self.__put(descriptor)
+        return True
+
+    def platform(self, label=None):
+        """Returns (label, install_json, additional_json) of a platform, the
+        most recently added one when label is not given"""
+        if not self.platforms:
+            raise BundleException("bundle has no install.json")
+        if label is None:
+            label = max(self.platforms, key=lambda key: self.platforms[key]["created"])
+        if label not in self.platforms:
+            raise BundleException(f"bundle has no platform {label}, available: {', '.join(self.platforms)}")
+        entry = self.platforms[label]
+        additional_json = self.__get(entry["additional"]) if entry["additional"] else []
+        return label, self.__get(entry["install"]), additional_json
+
+    def descriptor(self, module_id):
+        if module_id not in self.modules:
+            return None
+        return self.__get(self.modules[module_id])
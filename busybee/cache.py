@@ -0,0 +1,283 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+
+CACHE_VERSION = 1
+INDEX_NAME = "index.json"
+# compact the pack once more than this share of it is unused
+COMPACT_RATIO = 0.5
+
+
+class CacheException(Exception):
+    def __init__(self, message="Invalid module descriptor cache"):
+        self.message = message
+        super().__init__(self.message)
+
+
+def _encode(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+
+
+def _write_atomically(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as tmp_file:
+        tmp_file.write(data)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def _interfaces(interfaces):
+    # handlers and permissions of an interface are only needed by okapi
+    return tuple({"id": interface["id"], "version": interface.get("version")} for interface in interfaces or [])
+
+
+class ModuleRecord:
+    """What busybee keeps in memory about a cached module.
+
+    launch_descriptor, provides, requires and optional (interfaces reduced to
+    their id and version) are read from the descriptor the first time one of
+    them is used. The full descriptor is only read from the cache when it has
+    to be sent to okapi, see descriptor()."""
+
+    __slots__ = ("name", "id", "hash", "cache", "launch_descriptor", "provides", "requires", "optional")
+
+    def __init__(self, cache, name, module_id, digest):
+        self.cache = cache
+        self.name = name
+        self.id = module_id
+        self.hash = digest
+
+    def __getattr__(self, attribute):
+        # only called for the projected slots that are not filled yet
+        if attribute not in ("launch_descriptor", "provides", "requires", "optional"):
+            raise AttributeError(attribute)
+        descriptor = self.descriptor()
+        self.launch_descriptor = descriptor.get("launchDescriptor")
+        self.provides = _interfaces(descriptor.get("provides"))
+        self.requires = _interfaces(descriptor.get("requires"))
+        self.optional = _interfaces(descriptor.get("optional"))
+        return getattr(self, attribute)
+
+    def descriptor(self):
+        """Returns the full module descriptor, read from the cache"""
+        return self.cache.read(self.hash, self.id)
+
+    def interfaces(self):
+        """Returns the interfaces of the module in the shape build_dependency_graph expects"""
+        return {"provides": self.provides, "requires": self.requires, "optional": self.optional}
+
+
+class DescriptorCache:
+    """Module descriptor cache made of a small index and an append-only pack.
+
+    The index maps every module name to its id and to the sha256, offset and
+    length of its descriptor in the pack, so listing modules never parses a
+    descriptor. Descriptors are appended to the pack once per content hash and
+    read from a memory map on demand. The pack is synced before the index is
+    replaced, so a crash leaves at most unused bytes at the end of the pack.
+    Compaction writes a pack with a new generation number and only removes the
+    old one after the index points to the new one."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.lock = threading.Lock()
+        self.index = None
+        self.locations = {}
+        self.map = None
+        self.map_file = None
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    def pack_path(self, generation):
+        return os.path.join(self.directory, f"descriptors-{generation}.pack")
+
+    def load_index(self):
+        with self.lock:
+            if self.index is None:
+                self.__set_index(self.__read_index())
+            return self.index
+
+    def __read_index(self):
+        if not self.exists():
+            return {"version": CACHE_VERSION, "generation": 0, "size": 0, "modules": {}}
+        with open(self.index_path, "r") as json_file:
+            index = json.load(json_file)
+        if index.get("version") != CACHE_VERSION:
+            raise CacheException(f"unsupported cache version {index.get('version')} in {self.index_path}")
+        return index
+
+    def __pack_size(self, index):
+        try:
+            return os.path.getsize(self.pack_path(index["generation"]))
+        except OSError:
+            return None
+
+    def names(self):
+        return list(self.load_index()["modules"])
+
+    def load(self):
+        """Returns a ModuleRecord of every cached module without reading any descriptor"""
+        return {
+            name: ModuleRecord(self, name, entry["id"], entry["hash"])
+            for name, entry in self.load_index()["modules"].items()
+        }
+
+    def read(self, digest, module_id):
+        """Returns the descriptor with the sha256 digest. Descriptors are looked up by
+        their hash, so records loaded before a compaction can still be read."""
+        with self.lock:
+            location = self.locations.get(digest)
+            if location is None:
+                raise CacheException(f"descriptor of {module_id} is no longer in {self.directory}, run reload")
+            end = location["offset"] + location["length"]
+            if self.map is None or len(self.map) < end:
+                self.__open_map()
+            data = self.map[location["offset"]:end]
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise CacheException(f"descriptor of {module_id} in {self.directory} is corrupted, run reload")
+        return json.loads(data)
+
+    def __open_map(self):
+        self.__close_map()
+        pack_path = self.pack_path(self.index["generation"])
+        try:
+            self.map_file = open(pack_path, "rb")
+            self.map = mmap.mmap(self.map_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            # ValueError is raised for an empty pack, which can not be mapped
+            if self.map_file is not None:
+                self.map_file.close()
+            self.map = self.map_file = None
+            raise CacheException(f"could not read {pack_path}: {e}, run reload")
+
+    def __close_map(self):
+        if self.map is not None:
+            self.map.close()
+            self.map_file.close()
+        self.map = self.map_file = None
+
+    def save(self, modules):
+        """Writes modules to the cache, either ModuleRecords or {"id", "desc"} of new
+        descriptors. Descriptors already in the pack are not written again.
+        Returns the ModuleRecords of the cache."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            self.__close_map()
+            # the files may have changed since the index was loaded, so only trust what is on disk
+            index = self.__read_index()
+            stale_pack_path = None
+            pack_size = self.__pack_size(index)
+            if index["size"] and (pack_size is None or pack_size < index["size"]):
+                # the pack is gone or cut short, none of its entries can be reused
+                stale_pack_path = self.pack_path(index["generation"])
+                index = dict(index, generation=index["generation"] + 1, size=0, modules={})
+            self.__set_index(index)
+            entries_by_hash = dict(self.locations)
+
+        new_entries = {}
+        size = index["size"]
+        pack_path = self.pack_path(index["generation"])
+        with open(pack_path, "ab") as pack_file:
+            # start after the last indexed byte, dropping anything a crash left behind
+            pack_file.truncate(size)
+            for name, module in modules.items():
+                if isinstance(module, ModuleRecord):
+                    if module.cache is self and module.hash in entries_by_hash:
+                        new_entries[name] = dict(entries_by_hash[module.hash], id=module.id)
+                        continue
+                    module_id, descriptor = module.id, module.descriptor()
+                else:
+                    module_id, descriptor = module["id"], module["desc"]
+                data = _encode(descriptor)
+                digest = hashlib.sha256(data).hexdigest()
+                if digest not in entries_by_hash:
+                    pack_file.write(data)
+                    entries_by_hash[digest] = {"hash": digest, "offset": size, "length": len(data)}
+                    size += len(data)
+                new_entries[name] = dict(entries_by_hash[digest], id=module_id)
+            pack_file.flush()
+            os.fsync(pack_file.fileno())
+
+        self.__write_index(dict(index, size=size, modules=new_entries))
+        if stale_pack_path is not None and os.path.exists(stale_pack_path):
+            os.remove(stale_pack_path)
+        used = sum(location["length"] for location in self.locations.values())
+        if size and used < size * COMPACT_RATIO:
+            self.compact()
+        return self.load()
+
+    def compact(self):
+        """Rewrites the pack with only the descriptors the index refers to"""
+        index = self.load_index()
+        generation = index["generation"] + 1
+        entries_by_hash = {}
+        modules = {}
+        size = 0
+        with open(self.pack_path(generation), "wb") as pack_file:
+            for name, entry in index["modules"].items():
+                if entry["hash"] not in entries_by_hash:
+                    data = _encode(self.read(entry["hash"], entry["id"]))
+                    pack_file.write(data)
+                    entries_by_hash[entry["hash"]] = {"hash": entry["hash"], "offset": size, "length": len(data)}
+                    size += len(data)
+                modules[name] = dict(entries_by_hash[entry["hash"]], id=entry["id"])
+            pack_file.flush()
+            os.fsync(pack_file.fileno())
+
+        old_pack_path = self.pack_path(index["generation"])
+        self.__write_index(dict(index, generation=generation, size=size, modules=modules))
+        if os.path.exists(old_pack_path):
+            os.remove(old_pack_path)
+
+    def verify(self):
+        """Re-reads the index from disk and returns whether every descriptor it
+        refers to can be read back from the pack"""
+        with self.lock:
+            self.__close_map()
+            try:
+                self.__set_index(self.__read_index())
+            except (CacheException, ValueError):
+                return False
+            digests = {entry["hash"]: entry["id"] for entry in self.index["modules"].values()}
+        try:
+            for digest, module_id in digests.items():
+                self.read(digest, module_id)
+        except CacheException:
+            return False
+        return True
+
+    def clear(self):
+        """Removes the index and every pack of the cache"""
+        with self.lock:
+            self.__close_map()
+            if os.path.isdir(self.directory):
+                for file_name in os.listdir(self.directory):
+                    if file_name == INDEX_NAME or file_name.endswith(".pack"):
+                        os.remove(os.path.join(self.directory, file_name))
+            self.__set_index(self.__read_index())
+
+    def __write_index(self, index):
+        _write_atomically(self.index_path, json.dumps(index, indent=1).encode())
+        with self.lock:
+            self.__close_map()
+            self.__set_index(index)
+
+    def __set_index(self, index):
+        self.index = index
+        self.locations = {
+            entry["hash"]: {"hash": entry["hash"], "offset": entry["offset"], "length": entry["length"]}
+            for entry in index["modules"].values()
+        }
+
+    def migrate(self, legacy_path):
+        """Moves a .mod_descriptors.json cache into this cache and removes it"""
+        with open(legacy_path, "r") as json_file:
+            modules = json.load(json_file)
+        self.save(modules)
+        os.remove(legacy_path)
+        return len(modules)
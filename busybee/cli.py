@@ -3,8 +3,14 @@ from json import JSONDecodeError
 import cmd2
 import os
 import sys
+import time
 from blinker import signal
+from cmd2.rl_utils import vt100_support
 from .service import BusyBee
+from .jobs import JobManager, JobOutput
+from .batch import create_tenant_journal, run_journal, start_journal
+from .bundle import BundleException
+from .resources import format_memory
 from .config import gen_config, MissingConfigurationException
 
 class BusyBeeCli(cmd2.Cmd):
@@ -12,7 +18,9 @@ class BusyBeeCli(cmd2.Cmd):
     CMD_ENV_OPS = "Environment Operations"
     CMD_TENANT_OPS = "Tenant Operations"
     CMD_MODULE_OPS = "Module Operations"
-
+    CMD_JOB_OPS = "Job Operations"
+    # commands managing the shell or its jobs, which can't be background jobs themselves
+    FOREGROUND_COMMANDS = ("bg", "jobs", "wait", "cancel", "logs", "quit", "eof")
 
     def __new__(cls):
         if cls._instance is None:
@@ -20,6 +28,10 @@ class BusyBeeCli(cmd2.Cmd):
         return cls._instance
 
     def __init__(self, *args, **kwargs):
+        # what background jobs write goes to their own buffer instead of the terminal
+        if not isinstance(sys.stdout, JobOutput):
+            sys.stdout = JobOutput(sys.stdout)
+            sys.stderr = JobOutput(sys.stderr, error=True)
         super().__init__(*args, **kwargs)
         self.prompt = ">>"
 
@@ -29,7 +41,7 @@ class BusyBeeCli(cmd2.Cmd):
         self.error_msg.connect(self.perror)
 
         try:
-            self.busybee = BusyBee()
+            self.busybee = BusyBee(background=True)
         except MissingConfigurationException as e:
             self.perror(f'Could not start BusyBee: {e}')
             config_path = os.path.normpath(os.path.abspath(gen_config()))
@@ -44,23 +56,74 @@ class BusyBeeCli(cmd2.Cmd):
             self.perror(f'Could not start BusyBee: {e}')
             sys.exit()
 
+        self.jobs = JobManager(self.busybee._config.get("job-workers", 4))
+        # jobs that finished while a command was running, reported after it
+        self.finished_jobs = []
         self.poutput("Ready for your commands!")
 
+    def postcmd(self, stop, statement):
+        while self.finished_jobs:
+            self.poutput(self.job_status(self.finished_jobs.pop(0)))
+        return stop
+
+    def postloop(self):
+        running = self.jobs.running()
+        if running:
+            self.poutput(f"cancelling {len(running)} running jobs")
+        self.jobs.shutdown()
+
     ########################
     ### Commandline methods
     ########################
 
     def module_name_choice_provider(self):
-        return self.busybee._mod_descriptors.keys()
+        return self.busybee.module_names()
+
+    def tenant_profile_choice_provider(self):
+        return (self.busybee._config.get("tenant-profiles") or {}).keys()
+
+    start_argparser = cmd2.Cmd2ArgumentParser()
+    group = start_argparser.add_mutually_exclusive_group(required=False)
+    group.add_argument("--resume", action="store_true", help="skip the steps completed by the previous run")
+    group.add_argument("--fresh", action="store_true", help="discard the journal of the previous run")
+
+    @cmd2.with_argparser(start_argparser)  # type: ignore
+    @cmd2.with_category(CMD_ENV_OPS)
+    def do_start(self, args: Namespace):
+        """Initializes the environment and creates a tenant with enabled modules. Usage: start [--resume | --fresh]"""
+        run_journal(*start_journal(self.busybee, resume=args.resume, fresh=args.fresh))
+
+    plan_argparser = cmd2.Cmd2ArgumentParser()
+    plan_argparser.add_argument(
+        "-id",
+        "--identifier",
+        type=str,
+        required=False,
+        help="id of the tenant (defaults to the start tenant)",
+    )
 
+    @cmd2.with_argparser(plan_argparser)  # type: ignore
     @cmd2.with_category(CMD_ENV_OPS)
-    def do_start(self, arg):
-        """Initializes the environment and creates a tenant with enabled modules"""
-        self.busybee.set_module_env_vars()
-        self.busybee.register_modules()
-        self.busybee.create_tenant()
-        self.busybee.enable_modules_for_tenant()
-        self.busybee.create_tenant_admin()
+    def do_plan(self, args: Namespace):
+        """Shows what start would change in okapi. Usage: plan [-id TENANT_ID]"""
+        plan = self.busybee.plan(args.identifier)
+        for line in plan.describe():
+            self.poutput(line)
+
+    apply_argparser = cmd2.Cmd2ArgumentParser()
+    apply_argparser.add_argument(
+        "-id",
+        "--identifier",
+        type=str,
+        required=False,
+        help="id of the tenant (defaults to the start tenant)",
+    )
+
+    @cmd2.with_argparser(apply_argparser)  # type: ignore
+    @cmd2.with_category(CMD_ENV_OPS)
+    def do_apply(self, args: Namespace):
+        """Executes only the changes shown by plan. Usage: apply [-id TENANT_ID]"""
+        self.busybee.apply(args.identifier)
 
     deploy_argparser = cmd2.Cmd2ArgumentParser()
     deploy_argparser.add_argument(
@@ -68,16 +131,16 @@ class BusyBeeCli(cmd2.Cmd):
         "--module",
         type=str,
         required=True,
-        help="name of the module",
+        help="name of the module, or a comma separated list of modules deployed at the same time",
         choices_provider=module_name_choice_provider,
     )
 
     @cmd2.with_argparser(deploy_argparser)  # type: ignore
     @cmd2.with_category(CMD_MODULE_OPS)
     def do_deploy(self, args: Namespace):
-        """Deploys a specified module. Usage: deploy -m MODULE_NAME"""
-        module_name = args.module
-        return self.busybee.deploy_module(module_name=module_name)
+        """Deploys the specified modules on the nodes picked by the scheduler. Usage: deploy -m MODULE_NAME[,MODULE_NAME...]"""
+        module_names = [module_name.strip() for module_name in args.module.split(",") if module_name.strip()]
+        self.busybee.deploy_modules(module_names)
 
     undeploy_argparser = cmd2.Cmd2ArgumentParser()
     undeploy_argparser.add_argument(
@@ -95,6 +158,46 @@ class BusyBeeCli(cmd2.Cmd):
         module_name = args.module
         self.busybee.undeploy_module(module_name=module_name)
 
+    upgrade_argparser = cmd2.Cmd2ArgumentParser()
+    upgrade_argparser.add_argument(
+        "-m",
+        "--module",
+        type=str,
+        required=False,
+        help="comma separated list of modules to upgrade (defaults to every module with a new version)",
+        choices_provider=module_name_choice_provider,
+    )
+    @cmd2.with_argparser(upgrade_argparser)  # type: ignore
+    @cmd2.with_category(CMD_MODULE_OPS)
+    def do_upgrade(self: "BusyBeeCli", args: Namespace):
+        """Upgrades the modules to their install.json version: deploys the new instances, waits until they are ready,
+        upgrades every tenant with one install call and removes the old instances. Usage: upgrade [-m MODULE_NAME[,MODULE_NAME...]]"""
+        module_names = None
+        if args.module:
+            module_names = [module_name.strip() for module_name in args.module.split(",") if module_name.strip()]
+        failed = self.busybee.upgrade_modules(module_names)
+        if failed:
+            self.perror(f"could not upgrade {', '.join(failed)}, their old instances are kept")
+
+    redeploy_argparser = cmd2.Cmd2ArgumentParser()
+    redeploy_argparser.add_argument(
+        "-m",
+        "--module",
+        type=str,
+        required=True,
+        help="name of the module, or a comma separated list of modules",
+        choices_provider=module_name_choice_provider,
+    )
+    @cmd2.with_argparser(redeploy_argparser)  # type: ignore
+    @cmd2.with_category(CMD_MODULE_OPS)
+    def do_redeploy(self: "BusyBeeCli", args: Namespace):
+        """Replaces the instances of modules with new ones, removing the old ones once the new ones are ready.
+        Usage: redeploy -m MODULE_NAME[,MODULE_NAME...]"""
+        module_names = [module_name.strip() for module_name in args.module.split(",") if module_name.strip()]
+        failed = self.busybee.redeploy_modules(module_names)
+        if failed:
+            self.perror(f"could not redeploy {', '.join(failed)}, their old instances are kept")
+
     redirect_argparser = cmd2.Cmd2ArgumentParser()
     redirect_argparser.add_argument(
         "-m",
@@ -116,7 +219,8 @@ class BusyBeeCli(cmd2.Cmd):
         remove_redirect = args.remove
 
         if remove_redirect:
-            return self.busybee.remove_redirect(module_name=module_name)
+            self.busybee.remove_redirect(module_name=module_name)
+            return
 
         if http_location is not None:
             self.busybee.remove_redirect(module_name=module_name)
@@ -124,9 +228,104 @@ class BusyBeeCli(cmd2.Cmd):
 
     @cmd2.with_category(CMD_ENV_OPS)
     def do_reload(self: "BusyBeeCli", args: Namespace):
-        """Reloads the config file and rebuilds the mod descriptors cache"""
+        """Reloads the config file and refreshes the mod descriptors cache with added or changed modules"""
         self.busybee.reload()
 
+    @cmd2.with_category(CMD_MODULE_OPS)
+    def do_resources(self: "BusyBeeCli", args: Namespace):
+        """Shows the memory, heap and cpus each module gets when it is registered, from the resources section of the configuration file"""
+        try:
+            plan = self.busybee.resource_plan()
+        except Exception as e:
+            self.perror(str(e))
+            return
+        self.poutput(f"{'module':<40} {'profile':<12} {'memory':>8} {'heap':>8} {'cpus':>5}")
+        for module_name, resources in plan.items():
+            profile = resources["profile"] + (" *" if resources["overridden"] else "")
+            heap = format_memory(resources["heap"]) if resources["heap"] else "-"
+            self.poutput(
+                f"{module_name:<40} {profile:<12} {format_memory(resources['memory']):>8} {heap:>8} {resources['cpu'] or '-':>5}"
+            )
+        self.poutput(f"total memory: {format_memory(sum(resources['memory'] for resources in plan.values()))} (* = overridden per module)")
+
+    @cmd2.with_category(CMD_MODULE_OPS)
+    def do_health(self: "BusyBeeCli", args: Namespace):
+        """Checks every deployed module instance and redirect at the same time and shows their status and latency"""
+        report = self.busybee.health()
+        if not report:
+            self.poutput("no module is deployed")
+            return
+        self.poutput(f"{'module':<40} {'instance':<38} {'node':<16} {'status':<6} {'ms':>7}  message")
+        for instance in report:
+            status = "OK" if instance["healthStatus"] else "FAIL"
+            latency = f"{instance['seconds'] * 1000:.0f}" if instance["seconds"] is not None else "-"
+            self.poutput(
+                f"{instance['srvcId']:<40} {instance['instId']:<38} {instance.get('nodeId') or 'redirect':<16} "
+                f"{status:<6} {latency:>7}  {instance['healthMessage']}"
+            )
+        unhealthy = [instance for instance in report if not instance["healthStatus"]]
+        if unhealthy:
+            self.perror(f"{len(unhealthy)} of {len(report)} instances are not healthy")
+
+    stats_argparser = cmd2.Cmd2ArgumentParser()
+    stats_argparser.add_argument("-n", "--top", type=int, default=10, help="number of slowest modules to show")
+    group = stats_argparser.add_mutually_exclusive_group(required=False)
+    group.add_argument("--json", type=str, metavar="FILE", help="write every recorded call to FILE as JSON lines")
+    group.add_argument("--prometheus", type=str, metavar="FILE", help="write the statistics to FILE in prometheus text format")
+    group.add_argument("--clear", action="store_true", help="forget the recorded calls")
+    @cmd2.with_argparser(stats_argparser)  # type: ignore
+    @cmd2.with_category(CMD_ENV_OPS)
+    def do_stats(self: "BusyBeeCli", args: Namespace):
+        """Shows timing statistics of the HTTP calls made by busybee.
+        Usage: stats [-n TOP] [--json FILE | --prometheus FILE | --clear]"""
+        stats = self.busybee.stats
+        if args.clear:
+            stats.clear()
+            return
+        if args.json or args.prometheus:
+            with open(args.json or args.prometheus, "w") as stats_file:
+                stats_file.write(stats.to_json_lines() if args.json else stats.to_prometheus())
+            self.poutput(f"statistics written to {args.json or args.prometheus}")
+            return
+
+        summary = stats.endpoint_summary()
+        if not summary:
+            self.poutput("no calls recorded yet")
+            return
+        self.poutput(f"{'phase':<9} {'method':<6} {'endpoint':<58} {'count':>6} {'errors':>6} {'p50 s':>8} {'p95 s':>8} {'max s':>8}")
+        for item in summary:
+            self.poutput(
+                f"{item['phase']:<9} {item['method']:<6} {item['endpoint']:<58} {item['count']:>6} {item['errors']:>6} "
+                f"{item['p50']:>8.3f} {item['p95']:>8.3f} {item['max']:>8.3f}"
+            )
+        self.poutput("")
+        self.poutput(f"{'slowest modules':<45} {'calls':>6} {'total s':>9} {'max s':>8}")
+        for item in stats.slowest_modules(args.top):
+            self.poutput(f"{item['module']:<45} {item['count']:>6} {item['total']:>9.3f} {item['max']:>8.3f}")
+
+    bundle_argparser = cmd2.Cmd2ArgumentParser()
+    bundle_argparser.add_argument("action", choices=["export", "import"], help="export or import a bundle")
+    bundle_argparser.add_argument("-f", "--file", type=str, required=True, help="path of the bundle (.tar.gz)")
+    bundle_argparser.add_argument(
+        "-p",
+        "--platform",
+        type=str,
+        required=False,
+        help="platform label (export: defaults to the install.json hash, import: defaults to the latest export)",
+    )
+    @cmd2.with_argparser(bundle_argparser)  # type: ignore
+    @cmd2.with_category(CMD_ENV_OPS)
+    def do_bundle(self: "BusyBeeCli", args: Namespace):
+        """Exports install.json and the module descriptor cache to an offline bundle, or fills the cache from one.
+        Usage: bundle {export,import} -f FILE [-p PLATFORM]"""
+        try:
+            if args.action == "export":
+                self.busybee.export_bundle(args.file, args.platform)
+            else:
+                self.busybee.import_bundle(args.file, args.platform)
+        except BundleException as e:
+            self.perror(str(e))
+
     create_tenant_argparser = cmd2.Cmd2ArgumentParser()
     create_tenant_argparser.add_argument(
         "-id",
@@ -164,19 +363,224 @@ class BusyBeeCli(cmd2.Cmd):
         required=False,
         help="comma separated list of modules to disable in the tenant",
     )
+    create_tenant_argparser.add_argument(
+        "-p",
+        "--profile",
+        type=str,
+        required=False,
+        help="tenant profile deciding the data loaded by each module (defaults to tenant-profile)",
+        choices_provider=tenant_profile_choice_provider,
+    )
+    group = create_tenant_argparser.add_mutually_exclusive_group(required=False)
+    group.add_argument("--resume", action="store_true", help="skip the steps completed by the previous run")
+    group.add_argument("--fresh", action="store_true", help="discard the journal of the previous run")
     @cmd2.with_argparser(create_tenant_argparser)  # type: ignore
     @cmd2.with_category(CMD_TENANT_OPS)
     def do_create_tenant(self: "BusyBeeCli", args: Namespace):
         """Create a new tenant with modules in BusyBee configuration file.
-        Usage: create_tenant -id TENANT_ID [-n TENANT_NAME] [-d TENANT_DESCRIPTION] [-i INCLUDED_MODULES | -e EXCLUDED_MODULES]
-        Example: create_tenant -id test1 -e mod-copycat,mod-login-saml"""
-        self.busybee.create_tenant(args.identifier, args.name, args.description)
-        self.busybee.enable_modules_for_tenant(
-            args.identifier,
-            [] if args.include_modules is None else str(args.include_modules).split(","),
-            [] if args.exclude_modules is None else str(args.exclude_modules).split(","),
+        Usage: create_tenant -id TENANT_ID [-n TENANT_NAME] [-d TENANT_DESCRIPTION] [-i INCLUDED_MODULES | -e EXCLUDED_MODULES] [-p PROFILE] [--resume | --fresh]
+        Example: create_tenant -id test1 -e mod-copycat,mod-login-saml --profile minimal"""
+        include_modules = [] if args.include_modules is None else str(args.include_modules).split(",")
+        exclude_modules = [] if args.exclude_modules is None else str(args.exclude_modules).split(",")
+        run_journal(
+            *create_tenant_journal(
+                self.busybee,
+                args.identifier,
+                args.name,
+                args.description,
+                include_modules,
+                exclude_modules,
+                args.profile,
+                resume=args.resume,
+                fresh=args.fresh,
+            )
+        )
+
+    create_tenants_argparser = cmd2.Cmd2ArgumentParser()
+    group = create_tenants_argparser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "-id",
+        "--identifier",
+        type=str,
+        help="tenant id pattern, {} is replaced by the tenant number (e.g. load{:02}), which is appended when missing",
+    )
+    group.add_argument("-f", "--file", type=str, help="file with one tenant id per line")
+    create_tenants_argparser.add_argument("-c", "--count", type=int, default=1, help="number of tenants of the pattern")
+    create_tenants_argparser.add_argument("--first", type=int, default=1, help="number of the first tenant of the pattern")
+    group = create_tenants_argparser.add_mutually_exclusive_group(required=False)
+    group.add_argument(
+        "-i",
+        "--include-modules",
+        type=str,
+        required=False,
+        help="comma separated list of modules to enable in the tenants",
+    )
+    group.add_argument(
+        "-e",
+        "--exclude-modules",
+        type=str,
+        required=False,
+        help="comma separated list of modules to disable in the tenants",
+    )
+    create_tenants_argparser.add_argument(
+        "-p",
+        "--profile",
+        type=str,
+        required=False,
+        help="tenant profile deciding the data loaded by each module (defaults to tenant-profile)",
+        choices_provider=tenant_profile_choice_provider,
+    )
+    create_tenants_argparser.add_argument(
+        "-j", "--jobs", type=int, required=False, help="number of tenants provisioned at the same time (defaults to tenant-workers)"
+    )
+    @cmd2.with_argparser(create_tenants_argparser)  # type: ignore
+    @cmd2.with_category(CMD_TENANT_OPS)
+    def do_create_tenants(self: "BusyBeeCli", args: Namespace):
+        """Creates many tenants at the same time, each with the modules in BusyBee configuration file and an admin.
+        Usage: create_tenants {-id PATTERN [-c COUNT] [--first FIRST] | -f FILE} [-i INCLUDED_MODULES | -e EXCLUDED_MODULES] [-p PROFILE] [-j JOBS]
+        Example: create_tenants -id load{:02} -c 20 -j 8 --profile minimal"""
+        include_modules = [] if args.include_modules is None else str(args.include_modules).split(",")
+        exclude_modules = [] if args.exclude_modules is None else str(args.exclude_modules).split(",")
+        results = self.busybee.create_tenants(
+            self.tenant_ids(args), include_modules, exclude_modules, profile=args.profile, workers=args.jobs
         )
-        self.busybee.create_tenant_admin(args.identifier)
+        self.print_tenant_results(results, ["tenant", "enable", "admin"])
+
+    delete_tenants_argparser = cmd2.Cmd2ArgumentParser()
+    group = delete_tenants_argparser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-id", "--identifier", type=str, help="tenant id pattern, as in create_tenants")
+    group.add_argument("-f", "--file", type=str, help="file with one tenant id per line")
+    delete_tenants_argparser.add_argument("-c", "--count", type=int, default=1, help="number of tenants of the pattern")
+    delete_tenants_argparser.add_argument("--first", type=int, default=1, help="number of the first tenant of the pattern")
+    delete_tenants_argparser.add_argument(
+        "-j", "--jobs", type=int, required=False, help="number of tenants deleted at the same time (defaults to tenant-workers)"
+    )
+    @cmd2.with_argparser(delete_tenants_argparser)  # type: ignore
+    @cmd2.with_category(CMD_TENANT_OPS)
+    def do_delete_tenants(self: "BusyBeeCli", args: Namespace):
+        """Deletes many tenants at the same time. Usage: delete_tenants {-id PATTERN [-c COUNT] [--first FIRST] | -f FILE} [-j JOBS]"""
+        results = self.busybee.delete_tenants(self.tenant_ids(args), workers=args.jobs)
+        self.print_tenant_results(results, ["delete"])
+
+    def tenant_ids(self, args: Namespace):
+        if args.file:
+            with open(args.file, "r") as tenants_file:
+                return [line.strip() for line in tenants_file if line.strip() and not line.startswith("#")]
+        pattern = args.identifier if "{" in args.identifier else args.identifier + "{}"
+        return [pattern.format(number) for number in range(args.first, args.first + args.count)]
+
+    def print_tenant_results(self, results, steps):
+        self.poutput(f"{'tenant':<20} " + " ".join(f"{step + ' s':>9}" for step in steps) + f" {'total s':>9}  status")
+        for result in results:
+            seconds = result["seconds"]
+            columns = " ".join(f"{seconds[step]:>9.1f}" if step in seconds else f"{'-':>9}" for step in steps)
+            status = "ok" if result["error"] is None else result["error"]
+            self.poutput(f"{result['tenant']:<20} {columns} {sum(seconds.values()):>9.1f}  {status}")
+        failed = [result["tenant"] for result in results if result["error"] is not None]
+        if failed:
+            self.perror(f"{len(failed)} of {len(results)} tenants failed: {', '.join(failed)}")
+        else:
+            self.poutput(f"{len(results)} tenants done")
+
+    @cmd2.with_category(CMD_JOB_OPS)
+    def do_bg(self: "BusyBeeCli", statement: cmd2.Statement):
+        """Runs a command as a background job, so the shell can be used while it runs. Its output is kept for the logs command.
+        Usage: bg COMMAND [ARGS...]
+        Example: bg create_tenant -id test1"""
+        line = statement.args.strip()
+        command = line.split()[0] if line else ""
+        if not command:
+            self.perror("Usage: bg COMMAND [ARGS...]")
+            return
+        if command in self.FOREGROUND_COMMANDS or not hasattr(self, f"do_{command}"):
+            self.perror(f"{command} can't run as a background job")
+            return
+        job = self.jobs.submit(line, lambda: self.onecmd(line, add_to_history=False), self.job_finished)
+        self.poutput(f"[{job.id}] {line}")
+
+    def job_finished(self, job):
+        # the lock is free while the prompt waits for input
+        if vt100_support and self.use_rawinput and self.terminal_lock.acquire(blocking=False):
+            try:
+                self.async_alert(self.job_status(job))
+            finally:
+                self.terminal_lock.release()
+        else:
+            self.finished_jobs.append(job)
+
+    def job_status(self, job):
+        status = f"[{job.id}] {job.status} after {job.seconds:.1f}s: {job.command}"
+        return f"{status} ({job.error})" if job.error else status
+
+    @cmd2.with_category(CMD_JOB_OPS)
+    def do_jobs(self: "BusyBeeCli", args: Namespace):
+        """Lists the background jobs of this session"""
+        if not self.jobs.jobs:
+            self.poutput("no jobs")
+            return
+        self.poutput(f"{'job':>4}  {'status':<10} {'s':>8}  command")
+        for job in self.jobs.jobs.values():
+            self.poutput(f"{job.id:>4}  {job.status:<10} {job.seconds:>8.1f}  {job.command}")
+
+    wait_argparser = cmd2.Cmd2ArgumentParser()
+    wait_argparser.add_argument("job", type=int, nargs="*", help="job numbers (defaults to every unfinished job)")
+
+    @cmd2.with_argparser(wait_argparser)  # type: ignore
+    @cmd2.with_category(CMD_JOB_OPS)
+    def do_wait(self: "BusyBeeCli", args: Namespace):
+        """Waits until background jobs have finished. Usage: wait [JOB...]"""
+        for job in self.selected_jobs(args.job) if args.job else self.jobs.running():
+            job.done.wait()
+            if job in self.finished_jobs:
+                self.finished_jobs.remove(job)
+            if job.status == "failed":
+                self.perror(self.job_status(job))
+            else:
+                self.poutput(self.job_status(job))
+
+    cancel_argparser = cmd2.Cmd2ArgumentParser()
+    cancel_argparser.add_argument("job", type=int, nargs="*", help="job numbers (defaults to every unfinished job)")
+
+    @cmd2.with_argparser(cancel_argparser)  # type: ignore
+    @cmd2.with_category(CMD_JOB_OPS)
+    def do_cancel(self: "BusyBeeCli", args: Namespace):
+        """Cancels background jobs. A job stops before its next request to okapi;
+        journaled commands can be continued with --resume. Usage: cancel [JOB...]"""
+        for job in self.selected_jobs(args.job) if args.job else self.jobs.running():
+            job.cancel()
+            self.poutput(f"[{job.id}] {job.status}: {job.command}")
+
+    logs_argparser = cmd2.Cmd2ArgumentParser()
+    logs_argparser.add_argument("job", type=int, help="job number")
+    logs_argparser.add_argument("-f", "--follow", action="store_true", help="keep showing new output until the job has finished")
+
+    @cmd2.with_argparser(logs_argparser)  # type: ignore
+    @cmd2.with_category(CMD_JOB_OPS)
+    def do_logs(self: "BusyBeeCli", args: Namespace):
+        """Shows the output of a background job. Usage: logs JOB [-f]"""
+        jobs = self.selected_jobs([args.job])
+        if not jobs:
+            return
+        job = jobs[0]
+        shown = 0
+        while True:
+            finished = job.done.is_set()
+            chunks = job.output(shown)
+            shown += len(chunks)
+            for error, text in chunks:
+                (sys.stderr if error else self.stdout).write(text)
+            self.stdout.flush()
+            if finished or not args.follow:
+                break
+            time.sleep(0.2)
+        if finished:
+            self.poutput(f"[{job.id}] {job.status} after {job.seconds:.1f}s")
+
+    def selected_jobs(self, job_ids):
+        unknown = [str(job_id) for job_id in job_ids if self.jobs.get(job_id) is None]
+        if unknown:
+            self.perror(f"no such job: {', '.join(unknown)}")
+        return [self.jobs.get(job_id) for job_id in job_ids if self.jobs.get(job_id) is not None]
 
     delete_tenant_argparser = cmd2.Cmd2ArgumentParser()
     delete_tenant_argparser.add_argument(
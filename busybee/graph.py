@@ -0,0 +1,66 @@
+class DependencyCycleException(Exception):
+    def __init__(self, cycle):
+        self.cycle = cycle
+        self.message = f"module dependency cycle: {' -> '.join(cycle)}"
+        super().__init__(self.message)
+
+
+def build_dependency_graph(descriptors):
+    """Builds the interface dependency graph of a set of module descriptors.
+
+    descriptors maps a key (module name or id) to its module descriptor.
+    Returns (dependencies, missing): dependencies maps every key to the set of
+    keys providing the interfaces it requires (optional interfaces count only
+    when a provider is present), missing maps keys to the required interfaces
+    that no descriptor in the set provides."""
+    providers = {}
+    for key, descriptor in descriptors.items():
+        for interface in descriptor.get("provides", []):
+            providers.setdefault(interface["id"], []).append(key)
+
+    dependencies = {}
+    missing = {}
+    for key, descriptor in descriptors.items():
+        dependencies[key] = set()
+        for interface in descriptor.get("requires", []):
+            interface_providers = providers.get(interface["id"])
+            if not interface_providers:
+                missing.setdefault(key, []).append(interface["id"])
+                continue
+            dependencies[key].update(provider for provider in interface_providers if provider != key)
+        for interface in descriptor.get("optional", []):
+            dependencies[key].update(provider for provider in providers.get(interface["id"], []) if provider != key)
+    return dependencies, missing
+
+
+def topological_levels(dependencies):
+    """Groups the keys of a dependency graph into levels.
+
+    Every key only depends on keys of earlier levels, so all keys of one level
+    can be processed at the same time. Keys keep their original order inside a
+    level. Raises DependencyCycleException when the graph has a cycle."""
+    remaining = {key: set(deps) for key, deps in dependencies.items()}
+    levels = []
+    while remaining:
+        level = [key for key, deps in remaining.items() if not deps]
+        if not level:
+            raise DependencyCycleException(_find_cycle(remaining))
+        levels.append(level)
+        for key in level:
+            del remaining[key]
+        for deps in remaining.values():
+            deps.difference_update(level)
+    return levels
+
+
+def _find_cycle(dependencies):
+    # every remaining key has at least one remaining dependency, so walking
+    # dependencies from any key must eventually revisit a key
+    path = []
+    seen = {}
+    key = next(iter(dependencies))
+    while key not in seen:
+        seen[key] = len(path)
+        path.append(key)
+        key = sorted(dependencies[key])[0]
+    return path[seen[key]:] + [key]
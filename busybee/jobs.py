@@ -0,0 +1,150 @@
+import contextvars
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+current_job = contextvars.ContextVar("busybee_job", default=None)
+
+
+class JobCancelledException(Exception):
+    def __init__(self, message="Job was cancelled"):
+        self.message = message
+        super().__init__(self.message)
+
+
+def check_cancelled():
+    """Raises JobCancelledException when the job running in this context was cancelled"""
+    job = current_job.get()
+    if job is not None and job.cancel_requested.is_set():
+        raise JobCancelledException(f"job {job.id} was cancelled")
+
+
+def cancellable_sleep(seconds):
+    """time.sleep that ends early, raising JobCancelledException, when the current job is cancelled"""
+    job = current_job.get()
+    if job is None:
+        time.sleep(seconds)
+        return
+    job.cancel_requested.wait(seconds)
+    check_cancelled()
+
+
+class Job:
+    """A command running on a worker thread. Everything written to stdout or
+    stderr while it runs (see JobOutput) is kept in its own buffer."""
+
+    def __init__(self, job_id, command):
+        self.id = job_id
+        self.command = command
+        self.status = "queued"
+        self.error = None
+        self.exception = None
+        self.result = None
+        self.started = time.monotonic()
+        self.finished = None
+        self.cancel_requested = threading.Event()
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        # (is_error, text) in the order they were written
+        self.chunks = []
+
+    @property
+    def seconds(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def write(self, text, error=False):
+        with self.lock:
+            self.chunks.append((error, text))
+
+    def output(self, start=0):
+        """Returns the chunks written since chunk number start"""
+        with self.lock:
+            return self.chunks[start:]
+
+    def cancel(self):
+        if not self.done.is_set():
+            self.cancel_requested.set()
+            self.status = "cancelling"
+
+    def run(self, fn):
+        token = current_job.set(self)
+        self.started = time.monotonic()
+        try:
+            # a job cancelled while it was queued does not start
+            check_cancelled()
+            self.status = "running"
+            self.result = fn()
+            self.status = "done"
+        except JobCancelledException as e:
+            self.status = "cancelled"
+            self.error = str(e)
+            self.exception = e
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            self.exception = e
+            self.write(f"{e}\n", error=True)
+        finally:
+            current_job.reset(token)
+            self.finished = time.monotonic()
+            self.done.set()
+        return self
+
+
+class JobOutput:
+    """Stream writing to the job running in the current context, or to the
+    wrapped stream outside of jobs, so the output of jobs does not interleave"""
+
+    def __init__(self, stream, error=False):
+        self.stream = stream
+        self.error = error
+
+    def write(self, text):
+        job = current_job.get()
+        if job is None:
+            return self.stream.write(text)
+        job.write(text, self.error)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class JobManager:
+    """Runs jobs on a bounded pool of worker threads and keeps them for the jobs, wait and logs commands"""
+
+    def __init__(self, workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="busybee-job")
+        self.ids = itertools.count(1)
+        self.jobs = {}
+
+    def submit(self, command, fn, on_done=None):
+        """Runs fn as a job and calls on_done(job) once it has finished"""
+        job = Job(next(self.ids), command)
+        self.jobs[job.id] = job
+
+        def run():
+            job.run(fn)
+            if on_done is not None:
+                on_done(job)
+
+        # the job starts from a copy of the caller's context, outside of any other job
+        context = contextvars.copy_context()
+        self.executor.submit(context.run, run)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def running(self):
+        return [job for job in self.jobs.values() if not job.done.is_set()]
+
+    def shutdown(self):
+        """Cancels the running jobs and waits until they have stopped"""
+        for job in self.running():
+            job.cancel()
+        self.executor.shutdown(wait=True)
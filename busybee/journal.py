@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from blinker import signal
+from .config import USER_HOME_DIR
+
+
+def fingerprint(value):
+    """Short stable hash of a json-serializable value, e.g. the loaded config"""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class Journal:
+    """On-disk record of the completed steps of a multi-step command.
+
+    The journal of a command is kept under USER_HOME_DIR until all its steps
+    have completed, so a failed run can be resumed from the failed step. A
+    journal written for different arguments is never used for resuming."""
+
+    def __init__(self, name, args, resume=False, fresh=False):
+        self.term_messages = signal("output")
+        self.error_msg = signal("errors")
+        self.name = name
+        self.args = args
+        self.path = os.path.join(USER_HOME_DIR, f".journal-{name}.json")
+        self.steps = {}
+
+        if fresh:
+            self.finish()
+            return
+        previous = self.__read()
+        if previous is None:
+            return
+        if previous.get("args") != args:
+            self.term_messages.send(f"ignoring journal of {name}, it was written for different arguments")
+        elif resume:
+            self.steps = previous.get("steps", {})
+        else:
+            unfinished = [step for step, entry in previous.get("steps", {}).items() if entry["status"] != "done"]
+            if unfinished:
+                self.term_messages.send(
+                    f"previous {name} stopped at step {unfinished[0]}, use --resume to continue from there"
+                )
+
+    def __read(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r") as json_file:
+                return json.load(json_file)
+        except (IOError, ValueError):
+            return None
+
+    def __write(self):
+        os.makedirs(USER_HOME_DIR, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump({"args": self.args, "steps": self.steps}, json_file)
+        os.replace(tmp_path, self.path)
+
+    def is_done(self, step):
+        return self.steps.get(step, {}).get("status") == "done"
+
+    def run(self, step, fn):
+        """Runs fn unless the step is already done. A step fails when fn raises
+        or returns False. Returns whether the step is done."""
+        if self.is_done(step):
+            self.term_messages.send(f"skipping {step}, it was completed by a previous run")
+            return True
+
+        try:
+            result = fn()
+        except Exception:
+            self.__record(step, "failed")
+            raise
+        if result is False:
+            self.__record(step, "failed")
+            self.error_msg.send(f"{self.name} stopped at step {step}, fix the problem and run it again with --resume")
+            return False
+        self.__record(step, "done")
+        return True
+
+    def __record(self, step, status):
+        self.steps[step] = {"status": status, "time": datetime.now(timezone.utc).isoformat()}
+        self.__write()
+
+    def finish(self):
+        """Removes the journal once every step has completed"""
+        self.steps = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
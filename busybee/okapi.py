@@ -0,0 +1,119 @@
+import threading
+import time
+from .jobs import check_cancelled
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"])
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+
+class OkapiClient:
+    """HTTP client bound to one base URL.
+
+    Owns a pooled requests.Session so connections are kept alive between calls,
+    applies default headers and connect/read timeouts to every request and
+    retries idempotent calls with jittered exponential backoff. When a
+    RequestStats is given, every call is timed and recorded in it.
+    requests is only imported, and the session created, on the first call."""
+
+    def __init__(
+        self,
+        base_url,
+        tenant="supertenant",
+        connect_timeout=5,
+        read_timeout=900,
+        retries=3,
+        backoff=0.5,
+        pool_size=16,
+        stats=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats
+        self.timeout = (connect_timeout, read_timeout)
+        self.tenant = tenant
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            backoff_jitter=self.backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if self.tenant:
+            session.headers["X-Okapi-Tenant"] = self.tenant
+        return session
+
+    @classmethod
+    def from_config(cls, base_url, config, tenant="supertenant", pool_size=None, stats=None):
+        """Builds a client from the optional okapi-client section of config.yml"""
+        client_config = config.get("okapi-client") or {}
+        return cls(
+            base_url,
+            tenant=tenant,
+            connect_timeout=client_config.get("connect-timeout", 5),
+            read_timeout=client_config.get("read-timeout", 900),
+            retries=client_config.get("retries", 3),
+            backoff=client_config.get("backoff", 0.5),
+            pool_size=pool_size or client_config.get("pool-size", 16),
+            stats=stats,
+        )
+
+    def url(self, path):
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}{path}"
+
+    def request(self, method, path, **kwargs):
+        # every call is a point where a cancelled job stops
+        check_cancelled()
+        kwargs.setdefault("timeout", self.timeout)
+        if self.stats is None:
+            return self.session.request(method, self.url(path), **kwargs)
+
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            self.stats.record(method, path, status, time.perf_counter() - start, kwargs.get("json"))
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
@@ -0,0 +1,51 @@
+class Plan:
+    """Actions needed to bring okapi to the state described by config.yml.
+
+    Built by BusyBee.plan from a snapshot of okapi; every list only holds
+    what is missing or different, so an up to date environment has an empty
+    plan."""
+
+    def __init__(self, tenant_id, snapshot):
+        self.tenant_id = tenant_id
+        self.snapshot = snapshot
+        self.env_set = []
+        self.env_remove = []
+        self.register = []
+        self.create_tenant = False
+        self.enable = []
+        self.deploy = []
+        self.create_admin = False
+
+    @property
+    def empty(self):
+        return not (
+            self.env_set
+            or self.env_remove
+            or self.register
+            or self.create_tenant
+            or self.enable
+            or self.deploy
+            or self.create_admin
+        )
+
+    def describe(self):
+        """Returns the plan as printable lines"""
+        if self.empty:
+            return [f"nothing to do, okapi and tenant({self.tenant_id}) are up to date"]
+
+        lines = [f"plan for tenant({self.tenant_id}):"]
+        if self.env_set:
+            lines.append(f"  env: set {', '.join(self.env_set)}")
+        if self.env_remove:
+            lines.append(f"  env: remove {', '.join(self.env_remove)}")
+        if self.register:
+            lines.append(f"  register {len(self.register)} modules: {', '.join(self.register)}")
+        if self.create_tenant:
+            lines.append(f"  create tenant({self.tenant_id})")
+        if self.enable:
+            lines.append(f"  enable {len(self.enable)} modules: {', '.join(self.enable)}")
+        if self.deploy:
+            lines.append(f"  deploy {len(self.deploy)} enabled modules without instances: {', '.join(self.deploy)}")
+        if self.create_admin:
+            lines.append(f"  create tenant admin({self.snapshot['admin']['username']})")
+        return lines
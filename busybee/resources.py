@@ -0,0 +1,64 @@
+import re
+from .scheduler import parse_memory
+
+DEFAULT_PROFILES = {
+    "small": {"memory": "512m"},
+    "medium": {"memory": "1g"},
+    "large": {"memory": "2g"},
+}
+DEFAULT_PROFILE = "medium"
+DEFAULT_HEAP_PERCENT = 66
+HEAP_FLAGS = re.compile(r"\s*-(?:Xmx\S+|Xms\S+|XX:(?:MaxRAMPercentage|InitialRAMPercentage|MinRAMPercentage)=\S+)")
+
+
+def format_memory(size):
+    for unit, factor in (("g", 1024**3), ("m", 1024**2), ("k", 1024)):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return str(size)
+
+
+def module_resources(config, module_name):
+    """Returns {"profile", "overridden", "memory", "cpu", "heap"} of a module from the resources
+    section of config.yml. A module entry is either a profile name or settings
+    overriding those of the default profile. memory and heap are in bytes,
+    cpu in cores (None when not limited), heap is None when not derived."""
+    settings = config.get("resources") or {}
+    profiles = dict(DEFAULT_PROFILES, **(settings.get("profiles") or {}))
+    module_settings = (settings.get("modules") or {}).get(module_name) or {}
+    if isinstance(module_settings, str):
+        module_settings = {"profile": module_settings}
+
+    profile = module_settings.get("profile", settings.get("default", DEFAULT_PROFILE))
+    if profile not in profiles:
+        raise Exception(f"unknown resource profile({profile}) for {module_name}, available: {', '.join(profiles)}")
+    resources = dict(profiles[profile] or {}, **module_settings)
+
+    memory = parse_memory(resources.get("memory"))
+    heap_percent = resources.get("heap-percent", settings.get("heap-percent", DEFAULT_HEAP_PERCENT))
+    return {
+        "profile": profile,
+        "overridden": bool(set(module_settings) - {"profile"}),
+        "memory": memory,
+        "cpu": resources.get("cpu"),
+        "heap": memory * heap_percent // 100 // 1024**2 * 1024**2 if memory and heap_percent else None,
+    }
+
+
+def apply_resources(descriptor, resources):
+    """Sets the container limits of a module descriptor, and the heap flags of its
+    JAVA_OPTIONS, from module_resources"""
+    launch_descriptor = descriptor.get("launchDescriptor")
+    if not launch_descriptor:
+        return descriptor
+    host_config = launch_descriptor.setdefault("dockerArgs", {}).setdefault("HostConfig", {})
+    if resources["memory"]:
+        host_config["Memory"] = resources["memory"]
+    if resources["cpu"]:
+        host_config["NanoCpus"] = int(float(resources["cpu"]) * 1e9)
+    if resources["heap"]:
+        for env_var in launch_descriptor.get("env", []):
+            if env_var["name"] == "JAVA_OPTIONS":
+                java_options = HEAP_FLAGS.sub("", env_var.get("value", "")).strip()
+                env_var["value"] = f"{java_options} -Xmx{format_memory(resources['heap'])}".strip()
+    return descriptor
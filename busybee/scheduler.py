@@ -0,0 +1,79 @@
+import re
+
+STRATEGIES = ("least-loaded", "bin-packing")
+MEMORY_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+class SchedulingException(Exception):
+    def __init__(self, message="Module could not be placed on a node"):
+        self.message = message
+        super().__init__(self.message)
+
+
+def parse_memory(value):
+    """Returns a memory size in bytes from an int or a string such as 512m or 2g"""
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([bkmgt]?)i?b?\s*$", str(value).lower())
+    if not match:
+        raise SchedulingException(f"invalid memory size {value}, expected bytes or a size such as 512m or 2g")
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2)])
+
+
+def descriptor_memory(launch_descriptor):
+    """Returns the container memory limit declared in the launchDescriptor of a module, 0 when there is none"""
+    host_config = ((launch_descriptor or {}).get("dockerArgs") or {}).get("HostConfig") or {}
+    return host_config.get("Memory") or 0
+
+
+class Scheduler:
+    """Picks the okapi discovery node of every module instance to deploy.
+
+    The load of a node is the memory of the instances already running on it
+    plus the memory of the instances placed by this scheduler. least-loaded
+    spreads instances over the node with the most free memory, bin-packing
+    fills the fullest node that still has room first. Nodes without a known
+    capacity have room for everything."""
+
+    def __init__(self, nodes, instances, memory_of, strategy="least-loaded", capacity=None, pins=None):
+        if strategy not in STRATEGIES:
+            raise SchedulingException(f"unknown deploy strategy {strategy}, expected {', '.join(STRATEGIES)}")
+        self.nodes = list(nodes)
+        self.strategy = strategy
+        self.pins = pins or {}
+        capacity = capacity or {}
+        self.capacity = {node: parse_memory(capacity.get(node, capacity.get("default"))) for node in self.nodes}
+        self.load = {node: 0 for node in self.nodes}
+        for instance in instances:
+            if instance.get("nodeId") in self.load:
+                self.load[instance["nodeId"]] += memory_of(instance["srvcId"])
+
+    def free(self, node):
+        if not self.capacity[node]:
+            return float("inf")
+        return self.capacity[node] - self.load[node]
+
+    def place(self, module_name, memory):
+        """Returns the node for an instance of module_name needing memory bytes
+        and counts the instance in the load of that node"""
+        if not self.nodes:
+            raise SchedulingException("there are no nodes available")
+        if module_name in self.pins:
+            node = self.pins[module_name]
+            if node not in self.load:
+                raise SchedulingException(f"{module_name} is pinned to node {node}, which is not a discovery node")
+            candidates = [node]
+        else:
+            candidates = self.nodes
+
+        candidates = [node for node in candidates if self.free(node) >= memory]
+        if not candidates:
+            raise SchedulingException(f"no node has {memory} bytes of free memory left for {module_name}")
+        if self.strategy == "least-loaded":
+            node = min(candidates, key=lambda node: (-self.free(node), self.load[node]))
+        else:
+            node = min(candidates, key=lambda node: (self.free(node), -self.load[node]))
+        self.load[node] += memory
+        return node
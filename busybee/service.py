@@ -1,21 +1,37 @@
 from typing import Any, List
 from pathlib import Path
-import yaml
 import os
-import requests
 import re
 import json
-import jmespath
 import uuid
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from blinker import signal
+from .okapi import OkapiClient
+from .plan import Plan
+from .stats import RequestStats, phase
+from .jobs import cancellable_sleep, check_cancelled
+from .bundle import Bundle
+from .cache import DescriptorCache
+from .scheduler import Scheduler, SchedulingException, descriptor_memory, parse_memory
+from .resources import apply_resources, module_resources
+from .graph import DependencyCycleException, build_dependency_graph, topological_levels
 from .config import MissingConfigurationException, find_config_file, USER_HOME_DIR, CONFIG_LOCATIONS
 
+# tenantParameters of each kind of data a module can load when it is enabled
+TENANT_DATA_PARAMETERS = {
+    "none": "loadReference=false,loadSample=false",
+    "reference": "loadReference=true,loadSample=false",
+    "sample": "loadReference=true,loadSample=true",
+}
+
 
 class BusyBee:
     _instance = None
     _config = {}
     _install_json = {}
-    _mod_descriptors = {}
     tenant = {
         "id": "diku",
         "name": "Datalogisk Institut",
@@ -32,13 +48,58 @@ class BusyBee:
     instIdTemplate = "busybee-redirect::{}"
     okapi_url = ""
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, background=False, **kwargs):
         self.term_messages = signal("output")
         self.error_msg = signal("errors")
+        self.stats = RequestStats()
+        self.__mod_descriptors = {}
+        self.__descriptor_cache = DescriptorCache(self._descriptor_cache_dir())
+        self.__descriptors_error = None
+        self.__top_level_permissions = {}
+        self.__permissions_lock = threading.Lock()
+        self.__descriptors_ready = threading.Event()
+        self.__loader = None
+        self.__client_settings = None
 
         self.__load_config()
-        self.__load_mod_descriptors(False)
-        self.okapi_url = self._config["okapi-url"]
+        if not background:
+            self.__loader = threading.current_thread()
+            self.__load_mod_descriptors(False)
+            self.__descriptors_ready.set()
+            return
+
+        # the prompt is usable while the descriptors load, commands needing them wait
+        self.__loader = threading.Thread(target=self.__load_mod_descriptors_in_background, daemon=True)
+        self.__loader.start()
+
+    def __load_mod_descriptors_in_background(self):
+        try:
+            self.__load_mod_descriptors(False)
+        except Exception as e:
+            self.__descriptors_error = e
+            self.error_msg.send(f'could not load module descriptors: {e}\nRun the "reload" command to try again')
+        finally:
+            self.__descriptors_ready.set()
+
+    @property
+    def _mod_descriptors(self):
+        if threading.current_thread() is not self.__loader:
+            self.__descriptors_ready.wait()
+        if self.__descriptors_error is not None:
+            raise Exception(f"module descriptors are not loaded: {self.__descriptors_error}")
+        return self.__mod_descriptors
+
+    @_mod_descriptors.setter
+    def _mod_descriptors(self, mod_descriptors):
+        self.__mod_descriptors = mod_descriptors
+        self.__descriptors_error = None
+
+    def module_names(self):
+        """Returns the names of the cached modules. Until the descriptors are
+        loaded they come from the index of the descriptor cache."""
+        if not self.__descriptors_ready.is_set() and self.__descriptor_cache.exists():
+            return self.__descriptor_cache.names()
+        return list(self._mod_descriptors)
 
     def __load_config(self):
         # Find the configuration file
@@ -51,165 +112,404 @@ class BusyBee:
                 f"config file does not exist at any of these locations:\n {pretty_list}"
             )
 
+        import yaml
+
         p = Path(config_file_path)
 
         with p.open("r") as f:
             config: dict[str, Any] = yaml.safe_load(f)
         self._config = config
+        self.__create_clients()
 
-    def __load_mod_descriptors(self, force):
-        def fetch_content(path_or_url):
-            # Check if the input is likely a URL
-            if path_or_url.startswith(("http://", "https://")):
-                self.term_messages.send(f'Getting install.json from {path_or_url}')
-                try:
-                    response = requests.get(path_or_url)
-                    response.raise_for_status()
-                    return response.text
-                except requests.RequestException as e:
-                    return f"Error fetching content from URL: {e}"
+    def __create_clients(self):
+        config = self._config
+        client_settings = (
+            config["okapi-url"],
+            config["registry-url"],
+            config.get("okapi-client"),
+            config.get("registry-fetch-workers", 8),
+        )
+        # keep the pooled sessions when a reload did not change them
+        if client_settings == self.__client_settings:
+            return
+        if self.__client_settings is not None:
+            self.okapi.close()
+            self.registry.close()
+        self.__client_settings = client_settings
 
-            # Otherwise, treat it as a file path
-            try:
-                with open(path_or_url, "r") as file:
-                    return file.read()
-            except IOError as e:
-                return f"Error reading file: {e}"
+        self.okapi_url = config["okapi-url"]
+        self.okapi = OkapiClient.from_config(self.okapi_url, config, stats=self.stats)
+        self.registry = OkapiClient.from_config(
+            config["registry-url"],
+            config,
+            tenant=None,
+            pool_size=config.get("registry-fetch-workers", 8),
+            stats=self.stats,
+        )
 
-        config = self._config
-        if not "install-json-path" in config:
-            raise Exception("install-json-path is not present")
+    def __fetch_content(self, path_or_url):
+        # Check if the input is likely a URL
+        if path_or_url.startswith(("http://", "https://")):
+            import requests
 
-        mod_desc_cache_path = os.path.join(USER_HOME_DIR, ".mod_descriptors.json")
+            self.term_messages.send(f'Getting install.json from {path_or_url}')
+            try:
+                response = self.registry.get(path_or_url, timeout=self._config.get("registry-timeout", 30))
+                response.raise_for_status()
+                return response.text
+            except requests.RequestException as e:
+                return f"Error fetching content from URL: {e}"
 
-        if os.path.exists(mod_desc_cache_path) and not force:
-            # The file exists, so let's load its contents.
-            with open(mod_desc_cache_path, "r") as json_file:
-                self._mod_descriptors = json.load(json_file)
-                be_modules = config["be-modules"]
-                ui_modules = config["ui-modules"]
-                if set(be_modules).issubset(set(self._mod_descriptors.keys())) and set(ui_modules).issubset(set(self._mod_descriptors.keys())):
-                    self.term_messages.send(f'Using existing module descriptor cache at [{mod_desc_cache_path}]\nRun the "reload" command to recreate cache and reload config file')
-                    return
+        # Otherwise, treat it as a file path
+        try:
+            with open(path_or_url, "r") as file:
+                return file.read()
+        except IOError as e:
+            return f"Error reading file: {e}"
+
+    def __read_install_json(self):
+        """Returns the install.json list and the list of optional additional modules"""
+        config = self._config
+        install_json_content = self.__fetch_content(config["install-json-path"])
+        install_json = json.loads(install_json_content)
+        additional_install_json = []
 
-        install_json_content = fetch_content(config["install-json-path"])
-        self._install_json = json.loads(install_json_content)
-        
         # Check for optional additional modules
         if "additional-json-path" in config: 
             additional_json_path = config["additional-json-path"]
             
             if os.path.exists(additional_json_path):
                 print(f"Found additional modules from json path {additional_json_path}")
-                additional_json_content = fetch_content(additional_json_path)
+                additional_json_content = self.__fetch_content(additional_json_path)
                 additional_install_json = json.loads(additional_json_content)
                 additional_install_json_len = len(additional_install_json)
                 
                 if additional_install_json_len > 0:
                     additional_json_dump = json.dumps(additional_install_json, indent=4)
                     print(f'Preparing to append additional modules: {additional_json_dump}')
-                    self._install_json += additional_install_json
                     print(f"Appended {additional_install_json_len} additional modules to the list")
                 else:
                     print(f"Failed to append additional modules, the list is empty")
-        
-        registry_url = config["registry-url"]
-        for module in self._install_json:
+        return install_json, additional_install_json
+
+    def _wanted_modules(self, install_json):
+        """Maps the names of the configured modules to their id in install.json,
+        in install.json order (the last id listed for a name wins)"""
+        wanted_modules = {}
+        for module in install_json:
             module_id = module["id"]
-            module_name = ""
-            match = re.search(r"^([\w-]*)\-\d+.\d+[.\d+]*.*", module_id)
-            if match is not None:
-                module_name = match.group(1)
+            module_name = self._module_name(module_id)
             if (not module_name in self._config["be-modules"]) and (
                 not module_name in self._config["ui-modules"]
             ):
                 continue
+            wanted_modules[module_name] = module_id
+        return wanted_modules
 
-            self.term_messages.send(f"getting module: {module_id} from FOLIO registry")
-            module_desc_data = requests.get(
-                f"{registry_url}/_/proxy/modules/{module_id}"
-            )
+    @staticmethod
+    def _module_name(module_id):
+        match = re.search(r"^([\w-]*)\-\d+.\d+[.\d+]*.*", module_id)
+        return match.group(1) if match is not None else ""
+
+    def _mod_desc_cache_path(self):
+        # cache of busybee versions before the indexed descriptor cache, migrated on startup
+        return os.path.join(USER_HOME_DIR, ".mod_descriptors.json")
+
+    def _descriptor_cache_dir(self):
+        return os.path.join(USER_HOME_DIR, ".descriptor-cache")
+
+    def __write_mod_descriptors_cache(self, mod_descriptors):
+        # only ModuleRecords stay in memory, descriptors are read from the cache when needed
+        self._mod_descriptors = self.__descriptor_cache.save(mod_descriptors)
+        self.term_messages.send(f'Module descriptor cache written to {self._descriptor_cache_dir()}')
+
+    @phase("registry")
+    def __load_mod_descriptors(self, force):
+        config = self._config
+        if not "install-json-path" in config:
+            raise Exception("install-json-path is not present")
+        registry_timeout = config.get("registry-timeout", 30)
+        registry_workers = config.get("registry-fetch-workers", 8)
+
+        descriptor_cache = self.__descriptor_cache
+        cache_dir = self._descriptor_cache_dir()
+        legacy_cache_path = self._mod_desc_cache_path()
+        if not descriptor_cache.exists() and os.path.exists(legacy_cache_path):
+            migrated = descriptor_cache.migrate(legacy_cache_path)
+            self.term_messages.send(f"migrated {migrated} module descriptors from {legacy_cache_path} to {cache_dir}")
+
+        cached_descriptors = {}
+        if descriptor_cache.exists():
+            # only the index is read, descriptors are loaded when they are needed
+            cached_descriptors = descriptor_cache.load()
+            if not force:
+                self._mod_descriptors = cached_descriptors
+                be_modules = config["be-modules"]
+                ui_modules = config["ui-modules"]
+                if set(be_modules).issubset(set(cached_descriptors.keys())) and set(ui_modules).issubset(set(cached_descriptors.keys())):
+                    self.term_messages.send(f'Using existing module descriptor cache at [{cache_dir}]\nRun the "reload" command to refresh cache and reload config file')
+                    return
+            if descriptor_cache.verify():
+                # verify read the index again, the files may have changed since it was loaded
+                cached_descriptors = descriptor_cache.load()
+            else:
+                # a damaged cache can not be patched with its own entries, fetch everything again
+                self.error_msg.send(f"module descriptor cache at {cache_dir} is damaged, getting all descriptors again")
+                descriptor_cache.clear()
+                cached_descriptors = {}
+
+        bundle_path = config.get("descriptor-bundle")
+        if not force and not cached_descriptors and bundle_path and os.path.exists(bundle_path):
+            self.import_bundle(bundle_path)
+            return
+
+        install_json, additional_install_json = self.__read_install_json()
+        self._install_json = install_json + additional_install_json
+        wanted_modules = self._wanted_modules(self._install_json)
+
+        # only descriptors that are new or whose version changed have to be downloaded
+        to_fetch = [
+            (module_name, module_id)
+            for module_name, module_id in wanted_modules.items()
+            if module_name not in cached_descriptors or cached_descriptors[module_name].id != module_id
+        ]
+        removed = [module_name for module_name in cached_descriptors if module_name not in wanted_modules]
+
+        def fetch_descriptor(module):
+            _, module_id = module
+            return self.registry.get(f"/_/proxy/modules/{module_id}", timeout=registry_timeout)
+
+        self.term_messages.send(
+            f"getting {len(to_fetch)} modules from FOLIO registry ({registry_workers} at a time)"
+        )
+        fetched = {}
+        results = self._run_concurrently(fetch_descriptor, to_fetch, registry_workers)
+        for count, (module, module_desc_data, error) in enumerate(results, start=1):
+            module_name, module_id = module
+            if error is not None:
+                print(f"could not load {module_id}: {error}")
+                continue
             if module_desc_data.status_code != 200:
                 print(f"could not load {module_id}")
                 continue
-            self._mod_descriptors[module_name] = {
+            self.term_messages.send(f"[{count}/{len(to_fetch)}] got module: {module_id} from FOLIO registry")
+            fetched[module_name] = {
                 "id": module_id,
                 "desc": module_desc_data.json(),
             }
 
+        added, updated, failed = [], [], []
+        mod_descriptors = {}
+        for module_name, module_id in wanted_modules.items():
+            cached = cached_descriptors.get(module_name)
+            if module_name in fetched:
+                mod_descriptors[module_name] = fetched[module_name]
+                if cached is None:
+                    added.append(module_id)
+                else:
+                    updated.append(f"{cached.id} -> {module_id}")
+            elif cached is not None:
+                # unchanged, or the new version could not be loaded and the cached one is kept
+                mod_descriptors[module_name] = cached
+                if cached.id != module_id:
+                    failed.append(module_id)
+            else:
+                failed.append(module_id)
+
+        unchanged = len(wanted_modules) - len(added) - len(updated) - len(failed)
+        self.term_messages.send(
+            f"module descriptors: {len(added)} added, {len(updated)} updated, "
+            f"{len(removed)} removed, {unchanged} unchanged, {len(failed)} failed"
+        )
+        for label, items in (("added", added), ("updated", updated), ("removed", removed), ("failed", failed)):
+            if items:
+                self.term_messages.send(f"  {label}: {', '.join(items)}")
+
         # cache the mod-descriptors
-        with open(mod_desc_cache_path, "w") as json_file:
-            json.dump(self._mod_descriptors, json_file)
-        self.term_messages.send(f'Module descriptor cache created at {mod_desc_cache_path}')
+        self.__write_mod_descriptors_cache(mod_descriptors)
+
+    def _run_concurrently(self, fn, items, max_workers):
+        """Calls fn for every item on a bounded thread pool.
+        Yields (item, result, error) tuples in the order of items, as soon as
+        each one and all of the ones before it have completed. Calls run in a
+        copy of the caller's context, so they keep its stats phase."""
+        items = list(items)
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+            for item, future in zip(items, futures):
+                check_cancelled()
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
 
     def reload(self):
+        self.__descriptors_ready.wait()
         self.__load_config()
         self.__load_mod_descriptors(True)
 
-    def set_module_env_vars(self):
+    def export_bundle(self, path, label=None):
+        """Adds install.json and the cached module descriptors to the bundle at path"""
+        bundle = Bundle.read(path) if os.path.exists(path) else Bundle()
+        install_json, additional_install_json = self.__read_install_json()
+        label = bundle.add_platform(install_json, additional_install_json, label)
+        added = 0
+        for module in self._mod_descriptors.values():
+            if bundle.add_descriptor(module.id, module.descriptor()):
+                added += 1
+        bundle.write(path)
+        self.term_messages.send(
+            f"exported platform {label} with {len(self._mod_descriptors)} module descriptors ({added} new) to {path}"
+        )
+
+    def import_bundle(self, path, label=None):
+        """Fills the module descriptor cache from a bundle, without network access"""
+        bundle = Bundle.read(path)
+        label, install_json, additional_install_json = bundle.platform(label)
+        self._install_json = install_json + additional_install_json
+
+        mod_descriptors = {}
+        missing = []
+        for module_name, module_id in self._wanted_modules(self._install_json).items():
+            descriptor = bundle.descriptor(module_id)
+            if descriptor is None:
+                missing.append(module_id)
+                continue
+            mod_descriptors[module_name] = {"id": module_id, "desc": descriptor}
+
+        self.term_messages.send(f"imported {len(mod_descriptors)} module descriptors of platform {label} from {path}")
+        if missing:
+            self.error_msg.send(f"bundle has no descriptors for: {', '.join(missing)}")
+        self.__write_mod_descriptors_cache(mod_descriptors)
+
+    @phase("env")
+    def set_module_env_vars(self, current_env=None):
         print("###############")
         print("SETTING ENVIRONMENT VARIABLES")
         print("###############")
-        env_vars = self._config["env-vars"]
-        envs = [{"name": name, "value": value} for name, value in env_vars.items()]
-        # set okapi environment
-        for item in envs:
-            print(f'setting {item["name"]}')
-            resp = requests.post(
-                f"{self.okapi_url}/_/env",
-                json=item,
-                headers={"X-Okapi-Tenant": "supertenant"},
-            )
+        env_vars = self._desired_env_vars()
+
+        if current_env is None:
+            resp = self.okapi.get("/_/env")
+            if resp.status_code != 200:
+                raise Exception(f"could not get env vars: {resp.text}")
+            current_env = {item["name"]: item.get("value") for item in resp.json()}
+
+        added = [name for name in env_vars if name not in current_env]
+        changed = [name for name in env_vars if name in current_env and current_env[name] != env_vars[name]]
+        removed = [name for name in current_env if name not in env_vars]
+
+        def apply_change(change):
+            action, name = change
+            if action == "remove":
+                resp = self.okapi.delete(f"/_/env/{name}")
+                if resp.status_code != 204 and resp.status_code != 404:
+                    raise Exception(f"could not remove env var {name}: {resp.text}")
+                return
+            resp = self.okapi.post("/_/env", json={"name": name, "value": env_vars[name]})
             if resp.status_code != 201:
                 raise Exception(f"could not create env var: {resp.text}")
 
-    def register_modules(self):
+        changes = [("set", name) for name in added + changed] + [("remove", name) for name in removed]
+        failed = []
+        for (action, name), _, error in self._run_concurrently(apply_change, changes, self._config.get("okapi-workers", 4)):
+            if error is not None:
+                failed.append(name)
+                self.error_msg.send(str(error))
+
+        unchanged = len(env_vars) - len(added) - len(changed)
+        print(f"env vars: {len(added)} added, {len(changed)} changed, {len(removed)} removed, {unchanged} unchanged")
+        for label, names in (("added", added), ("changed", changed), ("removed", removed)):
+            if names:
+                print(f"  {label}: {', '.join(names)}")
+        if failed:
+            raise Exception(f"could not set env vars: {', '.join(failed)}")
+
+    def _desired_env_vars(self):
+        return {name: self._env_value(value) for name, value in self._config["env-vars"].items()}
+
+    @staticmethod
+    def _env_value(value):
+        # okapi stores env values as strings, booleans are written the way yaml/json spell them
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return str(value)
+
+    @phase("register")
+    def register_modules(self, registered_ids=None, module_names=None):
         print("###############")
         print("REGISTERING MODULES")
         print("###############")
         modules = self._mod_descriptors
+        if module_names is not None:
+            modules = {module_name: modules[module_name] for module_name in module_names}
 
-        for module in modules.values():
-            module_id = module["id"]
-            module_descriptor = module["desc"]
-            if "launchDescriptor" in module_descriptor:
-                module_descriptor["launchDescriptor"]["dockerArgs"]["HostConfig"]["Memory"] = 1073741824  # 1 GB in bytes default for all
-            if "mod-consortia" in modules and "mod-authtoken" in module_id:
-                env_vars = module_descriptor["launchDescriptor"]["env"]
-                for env_var in env_vars:
-                    if env_var["name"] == "JAVA_OPTIONS":
-                        env_var["value"] += " -Dallow.cross.tenant.requests=true"
-
-            if "mod-consortia" in module_id:
-                env_vars = module_descriptor["launchDescriptor"]["env"]
-                system_user_password_env = {"name": "SYSTEM_USER_PASSWORD", "value": "consortia-system-user"}
-                system_user_username_env = {"name": "SYSTEM_USER_NAME", "value": "consortia-system-user"}
-                env_vars.append(system_user_password_env)
-                env_vars.append(system_user_username_env)
-
-            # check if module is already registered
-            resp = requests.get(f"{self.okapi_url}/_/proxy/modules/{module_id}")
-            # if module is not registered, register it
-            if resp.status_code == 404:
-                reg_resp = requests.post(
-                    f"{self.okapi_url}/_/proxy/modules",
-                    json=module_descriptor,
-                    params={"check": "false"},
-                    headers={
-                        "X-Okapi-Tenant": "supertenant",
-                        "Content-type": "application/json",
-                        "Accept": "text/plain",
-                    },
-                )
-                if (not reg_resp.status_code == 200) and (
-                    not reg_resp.status_code == 201
-                ):
-                    raise Exception(f"could not register module: {reg_resp.text}")
-            else:
+        if registered_ids is None:
+            registered_ids = self._get_registered_module_ids()
+
+        to_register = []
+        for module_name, module in modules.items():
+            module_id = module.id
+            if module_id in registered_ids:
                 print(f"module {module_id} is already registered")
+                continue
+            to_register.append(self._prepare_module_descriptor(module_name))
 
-        pass
+        def register_module(module_descriptor):
+            return self.okapi.post(
+                "/_/proxy/modules",
+                json=module_descriptor,
+                params={"check": "false"},
+                headers={
+                    "Content-type": "application/json",
+                    "Accept": "text/plain",
+                },
+            )
 
+        failed = []
+        results = self._run_concurrently(register_module, to_register, self._config.get("okapi-workers", 4))
+        for module_descriptor, reg_resp, error in results:
+            module_id = module_descriptor["id"]
+            if error is not None:
+                failed.append(module_id)
+                self.error_msg.send(f"could not register module({module_id}): {error}")
+            elif reg_resp.status_code != 200 and reg_resp.status_code != 201:
+                failed.append(module_id)
+                self.error_msg.send(f"could not register module({module_id}): {reg_resp.text}")
+            else:
+                print(f"registered module {module_id}")
+
+        if failed:
+            raise Exception(f"could not register modules: {', '.join(failed)}")
+
+    def _get_registered_module_ids(self):
+        # one listing call tells which modules okapi already knows about
+        resp = self.okapi.get("/_/proxy/modules")
+        if resp.status_code != 200:
+            raise Exception(f"could not get registered modules: {resp.text}")
+        return {module["id"] for module in resp.json()}
+
+    def _prepare_module_descriptor(self, module_name):
+        """Returns the full module descriptor, read from the cache, with the busybee launch settings applied"""
+        modules = self._mod_descriptors
+        module_id = modules[module_name].id
+        module_descriptor = modules[module_name].descriptor()
+        apply_resources(module_descriptor, module_resources(self._config, module_name))
+        if "mod-consortia" in modules and "mod-authtoken" in module_id:
+            env_vars = module_descriptor["launchDescriptor"]["env"]
+            for env_var in env_vars:
+                if env_var["name"] == "JAVA_OPTIONS":
+                    env_var["value"] += " -Dallow.cross.tenant.requests=true"
+
+        if "mod-consortia" in module_id:
+            env_vars = module_descriptor["launchDescriptor"]["env"]
+            system_user_password_env = {"name": "SYSTEM_USER_PASSWORD", "value": "consortia-system-user"}
+            system_user_username_env = {"name": "SYSTEM_USER_NAME", "value": "consortia-system-user"}
+            env_vars.append(system_user_password_env)
+            env_vars.append(system_user_username_env)
+        return module_descriptor
+
+    @phase("tenant")
     def create_tenant(self, tenant_id="", tenant_name="", tenant_desc=""):
         print("###############")
         print("CREATING TENANT")
@@ -220,37 +520,44 @@ class BusyBee:
             tenant_desc = self.tenant["description"]
 
         # check tenant
-        resp = requests.get(f"{self.okapi_url}/_/proxy/tenants/{tenant_id}")
+        resp = self.okapi.get(f"/_/proxy/tenants/{tenant_id}")
         if resp.status_code == 200:
             self.error_msg.send(f"tenant({tenant_id}) already exists")
-            return
+            return True
 
         # create tenant
-        resp = requests.post(
-            f"{self.okapi_url}/_/proxy/tenants",
+        resp = self.okapi.post(
+            "/_/proxy/tenants",
             json={"id": tenant_id, "name": tenant_name, "description": tenant_desc},
-            headers={"X-Okapi-Tenant": "supertenant"},
         )
         if resp.status_code != 201:
             self.error_msg.send(f"could not create tenant({resp.text})")
-            return
+            return False
 
         # enable okapi for tenant
-        resp = requests.post(
-            f"{self.okapi_url}/_/proxy/tenants/{tenant_id}/modules",
+        resp = self.okapi.post(
+            f"/_/proxy/tenants/{tenant_id}/modules",
             json={"id": "okapi"},
-            headers={"X-Okapi-Tenant": "supertenant"},
         )
         if resp.status_code != 201:
             self.error_msg.send(f"could not enable okapi for tenant:{resp.text}")
-            return
+            return False
 
         self.term_messages.send(f"tenant({tenant_id}) has been created")
+        return True
 
-    def enable_modules_for_tenant(self, tenant_id: str = None, include_modules: List = [], exclude_modules: List = []):
-        modules = self._mod_descriptors.values()
+    @phase("enable")
+    def enable_modules_for_tenant(
+        self,
+        tenant_id: str = None,
+        include_modules: List = [],
+        exclude_modules: List = [],
+        enabled_ids=None,
+        profile=None,
+    ):
         if not tenant_id:
             tenant_id = self.tenant["id"]
+        tenant_profile = self._tenant_profile(profile)
         be_modules: List[str] = self._config["be-modules"]
         ui_modules: List[str] = self._config["ui-modules"]
 
@@ -264,100 +571,410 @@ class BusyBee:
             be_modules = [module for module in be_modules if module.strip() in include_modules]
             ui_modules = [module for module in ui_modules if module.strip() in include_modules]
 
-        def enable_be_module(module):
-            module_id = module["id"]
+        print("###############")
+        print("ENABLING MODULES TO TENANT")
+        print("###############")
+        if enabled_ids is None:
+            enabled_ids = self._get_enabled_module_ids(tenant_id)
+
+        def missing_modules(module_names):
+            missing = []
+            for item in module_names:
+                module_id = self._mod_descriptors[item].id
+                if module_id in enabled_ids:
+                    print(f"module({module_id}) is already enabled for tenant({tenant_id})")
+                else:
+                    missing.append(item)
+            return missing
+
+        def module_ids(module_names):
+            return [self._mod_descriptors[item].id for item in module_names]
+
+        settings = self._config.get("enable-modules") or {}
+        mode = settings.get("mode", "batch")
+
+        # order backend modules by their interface dependencies instead of their order in config.yml
+        try:
+            levels, dependencies = self._dependency_levels(be_modules)
+        except DependencyCycleException as e:
+            if mode == "levels":
+                raise
+            self.error_msg.send(f"{e}, keeping the order of be-modules")
+            levels, dependencies = [be_modules], {}
+        be_missing = missing_modules([item for level in levels for item in level])
+        ui_missing = missing_modules(ui_modules)
+        parameters = {item: self._tenant_parameters(tenant_profile, item) for item in be_missing}
+
+        # second wave modules, and the modules depending on them, are enabled after everything else
+        second_wave = set(tenant_profile.get("second-wave") or []) & set(be_missing)
+        while True:
+            waiting = [item for item in be_missing if item not in second_wave and dependencies.get(item, set()) & second_wave]
+            if not waiting:
+                break
+            second_wave.update(waiting)
+        first_wave = [item for item in be_missing if item not in second_wave]
+        second_wave = [item for item in be_missing if item in second_wave]
 
-            # check if module is already enabled
-            response = requests.get(
-                f"{self.okapi_url}/_/proxy/tenants/{tenant_id}/modules"
+        if mode == "serial":
+            for item in first_wave:
+                self._enable_be_module(tenant_id, self._mod_descriptors[item].id, parameters[item])
+            for module_id in module_ids(ui_missing):
+                self._enable_ui_module(tenant_id, module_id)
+            for item in second_wave:
+                self._enable_be_module(tenant_id, self._mod_descriptors[item].id, parameters[item])
+            self._wait_for_modules(module_ids(be_missing))
+            return
+
+        def enable_backend(module_names):
+            if mode == "levels":
+                missing_levels = [[item for item in level if item in module_names] for level in levels]
+                return self._enable_levels(
+                    tenant_id, [level for level in missing_levels if level], dependencies, parameters
+                )
+            # one batch per run of modules loading the same data, so the dependency order is kept
+            failed = []
+            start = 0
+            while start < len(module_names):
+                end = start + 1
+                while end < len(module_names) and parameters[module_names[end]] == parameters[module_names[start]]:
+                    end += 1
+                tenant_parameters = parameters[module_names[start]]
+                failed += self._install_batch(
+                    tenant_id,
+                    module_ids(module_names[start:end]),
+                    self._be_install_params(tenant_parameters),
+                    lambda tenant, module_id: self._enable_be_module(tenant, module_id, tenant_parameters),
+                )
+                start = end
+            return failed
+
+        failed = enable_backend(first_wave)
+        failed += self._install_batch(tenant_id, module_ids(ui_missing), {}, self._enable_ui_module)
+        if second_wave:
+            print(f"enabling second wave for tenant({tenant_id}): {', '.join(second_wave)}")
+            failed += enable_backend(second_wave)
+        if failed:
+            raise Exception(f"could not enable modules for tenant({tenant_id}): {', '.join(failed)}")
+        self._wait_for_modules(module_ids(be_missing))
+
+    def _wait_for_modules(self, module_ids):
+        """Waits until the instances okapi deployed for module_ids are ready"""
+        resp = self.okapi.get("/_/discovery/modules")
+        resp.raise_for_status()  # Raise an exception for HTTP errors
+        instances = [instance for instance in resp.json() if instance["srvcId"] in set(module_ids)]
+        not_ready = self.wait_until_ready(instances)
+        if not_ready:
+            raise Exception(f"modules are not ready: {', '.join(instance['srvcId'] for instance in not_ready)}")
+
+    def _tenant_profile(self, profile=None):
+        """Returns the tenant-profiles entry named profile, tenant-profile by default.
+        Without any profile every module loads reference and sample data."""
+        profiles = self._config.get("tenant-profiles") or {}
+        profile = profile or self._config.get("tenant-profile")
+        if not profile:
+            return {}
+        if profile not in profiles:
+            raise Exception(f"unknown tenant profile({profile}), available: {', '.join(profiles)}")
+        return profiles[profile] or {}
+
+    def _tenant_parameters(self, tenant_profile, module_name):
+        data = (tenant_profile.get("modules") or {}).get(module_name, tenant_profile.get("data", "sample"))
+        if data not in TENANT_DATA_PARAMETERS:
+            raise Exception(
+                f"unknown data({data}) for module({module_name}), expected {', '.join(TENANT_DATA_PARAMETERS)}"
             )
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            if module_id in response.text:
-                print(f"{module_id} is already enabled")
-                return
+        return TENANT_DATA_PARAMETERS[data]
 
-            print(f"enabling module({module_id}) for tenant({tenant_id})")
-            resp = requests.post(
-                f"{self.okapi_url}/_/proxy/tenants/{tenant_id}/install",
-                json=[{"id": module_id, "action": "enable"}],
-                params={
-                    "tenantParameters": "loadReference=true,loadSample=true",
-                    "deploy": "true",
-                    "depCheck": "false",
-                },
-                headers={"X-Okapi-Tenant": "supertenant"},
+    def _dependency_levels(self, module_names, report_missing=True):
+        """Groups module names into levels of the interface dependency graph built
+        from their cached descriptors. Returns (levels, dependencies)."""
+        descriptors = {item: self._mod_descriptors[item].interfaces() for item in module_names}
+        dependencies, missing = build_dependency_graph(descriptors)
+        for item, interfaces in (missing.items() if report_missing else []):
+            self.error_msg.send(
+                f"no selected module provides the interfaces required by {item}: {', '.join(interfaces)}"
             )
-            if (
-                resp.status_code != 201
-                and resp.status_code != 200
-                and "has no launchDescriptor" not in resp.text
-            ):
-                raise Exception(
-                    f"could not create enable module({module_id}) for tenant({tenant_id}): {resp.text}"
+        return topological_levels(dependencies), dependencies
+
+    def _enable_levels(self, tenant_id, levels, dependencies, parameters):
+        """Enables the modules of each dependency level at the same time, one level
+        after the other, with the tenantParameters given per module name.
+        Modules that depend on a failed module are skipped.
+        Returns the ids that failed or were skipped."""
+        failed_modules = set()
+        failed = []
+        for number, level in enumerate(levels, start=1):
+            to_enable = []
+            for item in level:
+                module_id = self._mod_descriptors[item].id
+                blocked_by = dependencies[item] & failed_modules
+                if blocked_by:
+                    failed_modules.add(item)
+                    failed.append(module_id)
+                    self.error_msg.send(f"skipping module({module_id}), it depends on {', '.join(sorted(blocked_by))}")
+                else:
+                    to_enable.append((item, module_id))
+
+            print(f"enabling dependency level {number}/{len(levels)} for tenant({tenant_id}): {', '.join(item for item, _ in to_enable)}")
+            if self._async_install():
+                errors = self._install_level_jobs(
+                    tenant_id, {module_id: parameters[item] for item, module_id in to_enable}
                 )
-            print(f"enabled module({module_id}) for tenant({tenant_id})")
+            else:
+                results = self._run_concurrently(
+                    lambda module: self._enable_be_module(tenant_id, module[1], parameters[module[0]]),
+                    to_enable,
+                    self._config.get("okapi-workers", 4),
+                )
+                errors = {module[1]: str(error) for module, _, error in results if error is not None}
+            for item, module_id in to_enable:
+                if module_id in errors:
+                    failed_modules.add(item)
+                    failed.append(module_id)
+                    self.error_msg.send(errors[module_id])
+        return failed
 
-        def enable_ui_module(module):
-            module_id = module["id"]
-            module_descriptor = module["desc"]
-            resp = requests.get(
-                f"{self.okapi_url}/_/proxy/tenants/{tenant_id}/modules/{module_id}"
+    def _be_install_params(self, tenant_parameters=TENANT_DATA_PARAMETERS["sample"]):
+        return {
+            "tenantParameters": tenant_parameters,
+            "deploy": "true",
+        }
+
+    def _get_enabled_module_ids(self, tenant_id):
+        response = self.okapi.get(f"/_/proxy/tenants/{tenant_id}/modules")
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        return {module["id"] for module in response.json()}
+
+    def _install_batch(self, tenant_id, module_ids, params, enable_module):
+        """Enables module_ids with as few install calls as possible.
+        When a call fails, the modules of that call which are still not enabled
+        are retried one by one with enable_module. Returns the ids that failed."""
+        settings = self._config.get("enable-modules") or {}
+        batch_size = settings.get("batch-size", 0) or len(module_ids)
+        params = dict(params, depCheck="true" if settings.get("dep-check", False) else "false")
+
+        failed = []
+        for start in range(0, len(module_ids), max(1, batch_size)):
+            chunk = module_ids[start:start + batch_size]
+            print(f"enabling modules({', '.join(chunk)}) for tenant({tenant_id})")
+            error = self._install(tenant_id, chunk, params)
+            if error is None:
+                print(f"enabled {len(chunk)} modules for tenant({tenant_id})")
+                continue
+
+            self.error_msg.send(
+                f"could not enable modules together for tenant({tenant_id}), enabling them one by one: {error}"
             )
+            enabled_ids = self._get_enabled_module_ids(tenant_id)
+            for module_id in chunk:
+                if module_id in enabled_ids:
+                    continue
+                try:
+                    enable_module(tenant_id, module_id)
+                except Exception as e:
+                    failed.append(module_id)
+                    self.error_msg.send(str(e))
+        return failed
 
-            # if module is not enabled, enable it
-            if resp.status_code == 404:
-                print(f"enabling ui module({module_id}) for tenant({tenant_id})")
-                resp = requests.post(
-                    f"{self.okapi_url}/_/proxy/tenants/{tenant_id}/modules",
-                    json={"id": module_id},
-                    headers={"X-Okapi-Tenant": "supertenant"},
-                    params={"depCheck": "false"},
-                )
-                if resp.status_code != 201 and resp.status_code != 200:
-                    raise Exception(
-                        f"could not create enable module({module_id}) for tenant({tenant_id}): {resp.text}"
-                    )
+    def _enable_be_module(self, tenant_id, module_id, tenant_parameters=TENANT_DATA_PARAMETERS["sample"]):
+        print(f"enabling module({module_id}) for tenant({tenant_id})")
+        error = self._install(tenant_id, [module_id], dict(self._be_install_params(tenant_parameters), depCheck="false"))
+        if error is not None and "has no launchDescriptor" not in error:
+            raise Exception(
+                f"could not create enable module({module_id}) for tenant({tenant_id}): {error}"
+            )
+        print(f"enabled module({module_id}) for tenant({tenant_id})")
+
+    def _async_install(self):
+        settings = self._config.get("enable-modules") or {}
+        return settings.get("async", False)
+
+    def _install(self, tenant_id, module_ids, params):
+        """Enables module_ids with one install call, submitted as an install job
+        when enable-modules.async is set. Returns None on success, else the error."""
+        if not self._async_install():
+            resp = self.okapi.post(
+                f"/_/proxy/tenants/{tenant_id}/install",
+                json=[{"id": module_id, "action": "enable"} for module_id in module_ids],
+                params=params,
+            )
+            if resp.status_code == 200 or resp.status_code == 201:
+                return None
+            return resp.text
+
+        try:
+            job = self._submit_install_job(tenant_id, module_ids, params)
+        except Exception as e:
+            return str(e)
+        failures = self._await_install_jobs([job])
+        if not failures:
+            return None
+        return "; ".join(f"{module_id}: {message}" for module_id, message in failures.items())
+
+    def _install_level_jobs(self, tenant_id, modules):
+        """Submits one install job per module, with the tenantParameters given per
+        module id, and waits for all of them.
+        Returns {module_id: error} of the modules that could not be enabled."""
+        jobs = []
+        errors = {}
+        results = self._run_concurrently(
+            lambda module_id: self._submit_install_job(
+                tenant_id, [module_id], dict(self._be_install_params(modules[module_id]), depCheck="false")
+            ),
+            list(modules),
+            self._config.get("okapi-workers", 4),
+        )
+        for module_id, job, error in results:
+            if error is not None:
+                errors[module_id] = str(error)
             else:
-                print(f"module({module_id}) is already enabled for tenant({tenant_id})")
+                jobs.append(job)
+        for module_id, message in self._await_install_jobs(jobs).items():
+            if "has no launchDescriptor" not in message:
+                errors[module_id] = f"could not create enable module({module_id}) for tenant({tenant_id}): {message}"
+        return errors
 
-        print("###############")
-        print("ENABLING MODULES TO TENANT")
-        print("###############")
-        for item in be_modules:
-            module = self._mod_descriptors[item]
-            enable_be_module(module)
+    def _submit_install_job(self, tenant_id, module_ids, params):
+        resp = self.okapi.post(
+            f"/_/proxy/tenants/{tenant_id}/install",
+            json=[{"id": module_id, "action": "enable"} for module_id in module_ids],
+            params=dict(params, **{"async": "true"}),
+        )
+        if resp.status_code != 201 and resp.status_code != 200:
+            raise Exception(f"could not submit install job for tenant({tenant_id}): {resp.text}")
+        return {"tenant": tenant_id, "id": resp.json()["id"], "modules": module_ids}
 
-        for item in ui_modules:
-            module = self._mod_descriptors[item]
-            enable_ui_module(module)
+    def _await_install_jobs(self, jobs):
+        """Polls all install jobs at once, backing off between rounds, until they
+        are complete or enable-modules.install-timeout runs out. Prints the stage
+        changes of every module. Returns {module_id: message} of failed modules."""
+        settings = self._config.get("enable-modules") or {}
+        interval = settings.get("poll-interval", 1)
+        max_interval = settings.get("poll-max-interval", 10)
+        deadline = time.monotonic() + settings.get("install-timeout", 3600)
 
+        def poll(job):
+            resp = self.okapi.get(f"/_/proxy/tenants/{job['tenant']}/install/{job['id']}")
+            resp.raise_for_status()  # Raise an exception for HTTP errors
+            return resp.json()
+
+        stages = {}
+        failures = {}
+        pending = list(jobs)
+        while pending:
+            cancellable_sleep(min(interval, max(0, deadline - time.monotonic())))
+            still_pending = []
+            for job, status, error in self._run_concurrently(poll, pending, len(pending)):
+                if error is not None:
+                    # keep polling, the job goes on in okapi
+                    self.error_msg.send(f"could not poll install job({job['id']}) for tenant({job['tenant']}): {error}")
+                    still_pending.append(job)
+                    continue
+                for module in status.get("modules", []):
+                    key = (job["id"], module["id"])
+                    if module.get("stage") != stages.get(key):
+                        stages[key] = module.get("stage")
+                        print(f"module({module['id']}) for tenant({job['tenant']}): {module.get('stage')}")
+                    if module.get("message"):
+                        failures[module["id"]] = module["message"]
+                if not status.get("complete"):
+                    still_pending.append(job)
+            pending = still_pending
+
+            if pending and time.monotonic() >= deadline:
+                for job in pending:
+                    for module_id in job["modules"]:
+                        failures.setdefault(module_id, f"install job({job['id']}) did not complete in time")
+                break
+            interval = min(interval * 2, max_interval)
+        return failures
+
+    def _enable_ui_module(self, tenant_id, module_id):
+        print(f"enabling ui module({module_id}) for tenant({tenant_id})")
+        resp = self.okapi.post(
+            f"/_/proxy/tenants/{tenant_id}/modules",
+            json={"id": module_id},
+            params={"depCheck": "false"},
+        )
+        if resp.status_code != 201 and resp.status_code != 200:
+            raise Exception(
+                f"could not create enable module({module_id}) for tenant({tenant_id}): {resp.text}"
+            )
+
+    @phase("tenant")
     def delete_tenant(self, tenant_id: str):
         print("###############")
         print("DELETING TENANT")
         print("###############")
 
         # check tenant
-        resp = requests.get(f"{self.okapi_url}/_/proxy/tenants/{tenant_id}")
+        resp = self.okapi.get(f"/_/proxy/tenants/{tenant_id}")
         if resp.status_code != 200:
             self.error_msg.send(f"tenant({tenant_id}) does not exists")
-            return
+            return False
 
         # delete tenant
-        resp = requests.delete(
-            f"{self.okapi_url}/_/proxy/tenants/{tenant_id}",
-            headers={"X-Okapi-Tenant": "supertenant"},
+        resp = self.okapi.delete(
+            f"/_/proxy/tenants/{tenant_id}",
         )
         if resp.status_code != 204:
             self.error_msg.send(f"could not create tenant:{resp.text}")
-            return
+            return False
 
         self.term_messages.send(f"tenant({tenant_id}) has been deleted")
+        return True
 
+    def create_tenants(self, tenant_ids, include_modules=[], exclude_modules=[], profile=None, workers=None):
+        """Creates tenant_ids, enables their modules and creates their admins,
+        tenant-workers tenants at a time. The modules are registered once for all
+        of them. Returns one result per tenant (see _run_tenant_steps)."""
+        self.register_modules()
+
+        def provision(tenant_id):
+            return self._run_tenant_steps(
+                tenant_id,
+                [
+                    ("tenant", lambda: self.create_tenant(tenant_id, tenant_id, tenant_id)),
+                    ("enable", lambda: self.enable_modules_for_tenant(tenant_id, include_modules, exclude_modules, profile=profile)),
+                    ("admin", lambda: self.create_tenant_admin(tenant_id)),
+                ],
+            )
+
+        workers = workers or self._config.get("tenant-workers", 4)
+        return [result for _, result, _ in self._run_concurrently(provision, tenant_ids, workers)]
+
+    def delete_tenants(self, tenant_ids, workers=None):
+        """Deletes tenant_ids, tenant-workers tenants at a time. Returns one result
+        per tenant (see _run_tenant_steps)."""
+        workers = workers or self._config.get("tenant-workers", 4)
+        results = self._run_concurrently(
+            lambda tenant_id: self._run_tenant_steps(tenant_id, [("delete", lambda: self.delete_tenant(tenant_id))]),
+            tenant_ids,
+            workers,
+        )
+        return [result for _, result, _ in results]
+
+    def _run_tenant_steps(self, tenant_id, steps):
+        """Runs steps until one fails (returns False or raises). Returns
+        {"tenant", "seconds": {step: seconds}, "error"}, error being None on success."""
+        result = {"tenant": tenant_id, "seconds": {}, "error": None}
+        for step, fn in steps:
+            start = time.perf_counter()
+            try:
+                if fn() is False:
+                    result["error"] = f"{step} failed"
+            except Exception as e:
+                result["error"] = f"{step} failed: {e}"
+            result["seconds"][step] = time.perf_counter() - start
+            if result["error"] is not None:
+                self.error_msg.send(f"tenant({tenant_id}): {result['error']}")
+                break
+        return result
+
+    @phase("admin")
     def create_tenant_admin(self, tenant_id: str = None):
-        admin_user = self.admin_user
-        if tenant_id:
-            admin_user['username'] = tenant_id + '_admin'
-        else:
+        admin_user = dict(self.admin_user, username=self._admin_username(tenant_id))
+        if not tenant_id:
             tenant_id = self.tenant["id"]
 
         print("###############")
@@ -365,8 +982,8 @@ class BusyBee:
         print("###############")
 
         def set_authtoken_status(is_enabled):
-            resp = requests.get(
-                f"{self.okapi_url}/_/proxy/tenants/{tenant_id}/interfaces/authtoken"
+            resp = self.okapi.get(
+                f"/_/proxy/tenants/{tenant_id}/interfaces/authtoken"
             )
             if resp.status_code != 200:
                 raise Exception(f"could not determine authtoken status: {resp.text}")
@@ -376,15 +993,15 @@ class BusyBee:
             if authtoken_module_json != [] and is_enabled is False:
                 # authtoken is enabled, disable it
                 authtoken_module_id = authtoken_module_json[0]["id"]
-                resp = requests.delete(
-                    f"{self.okapi_url}/_/proxy/tenants/{tenant_id}/modules/{authtoken_module_id}"
+                resp = self.okapi.delete(
+                    f"/_/proxy/tenants/{tenant_id}/modules/{authtoken_module_id}"
                 )
                 if resp.status_code != 204:
                     raise Exception(f"could not disable authtoken module: {resp.text}")
             elif authtoken_module_json == [] and is_enabled is True:
                 # get authtoken module id
-                resp = requests.get(
-                    f"{self.okapi_url}/_/proxy/modules?filter=mod-authtoken"
+                resp = self.okapi.get(
+                    "/_/proxy/modules?filter=mod-authtoken"
                 )
                 resp_json = resp.json()
                 if resp.status_code == 404 or (
@@ -396,39 +1013,18 @@ class BusyBee:
                 elif len(resp_json) > 0 and resp.status_code == 200:
                     authtoken_module_id = resp_json[0]["id"]
                 # authtoken is disabled, enable it
-                resp = requests.post(
-                    f"{self.okapi_url}/_/proxy/tenants/{tenant_id}/modules",
+                resp = self.okapi.post(
+                    f"/_/proxy/tenants/{tenant_id}/modules",
                     json={"id": authtoken_module_id},
                     params={"depCheck": "false"},
                 )
                 if resp.status_code != 201:
                     raise Exception(f"could not disable authtoken module: {resp.text}")
 
-        def set_tenant_admin_permissions(okapi_url: str, tenant_id, user_id):
-            resp = requests.get(
-                f"{okapi_url}/perms/permissions",
-                params={
-                    "query": "cql.allRecords=1 not permissionName==perms.users.assign.okapi not permissionName==modperms.* not permissionName==SYS#*",
-                    "length": "5000",
-                },
-                headers={"X-Okapi-Tenant": tenant_id},
-            )
-
-            if resp.status_code != 200:
-                raise Exception(
-                    f"something happened when getting all permissions: {resp.text}"
-                )
-
-            expression = jmespath.compile(
-                "permissions[?length(childOf[?starts_with(@,'SYS#')]) == length(childOf)].permissionName"
-            )
-            top_level_perms = expression.search(resp.json())
-            return top_level_perms
-
         def create_user_record(user_dict):
             # check for user record
-            resp = requests.get(
-                f"{self.okapi_url}/users?query=username%3d%3d{user_dict['username']}",
+            resp = self.okapi.get(
+                f"/users?query=username%3d%3d{user_dict['username']}",
                 headers={"X-Okapi-Tenant": tenant_id},
             )
             if resp.status_code != 200:
@@ -436,8 +1032,8 @@ class BusyBee:
             user_json = resp.json()
             if user_json["totalRecords"] == 0:
                 # create user record
-                resp = requests.post(
-                    f"{self.okapi_url}/users",
+                resp = self.okapi.post(
+                    "/users",
                     headers={"X-Okapi-Tenant": tenant_id},
                     json={
                         "id": str(uuid.uuid4()),
@@ -466,8 +1062,8 @@ class BusyBee:
         admin_user_id = create_user_record(admin_user)
 
         # check login record
-        resp = requests.get(
-            f"{self.okapi_url}/authn/credentials-existence?userId={admin_user_id}",
+        resp = self.okapi.get(
+            f"/authn/credentials-existence?userId={admin_user_id}",
             headers={"X-Okapi-Tenant": tenant_id},
         )
         if resp.status_code != 200:
@@ -475,8 +1071,8 @@ class BusyBee:
         cred_json = resp.json()
         if cred_json["credentialsExist"] == False:
             # create login record
-            resp = requests.post(
-                f"{self.okapi_url}/authn/credentials",
+            resp = self.okapi.post(
+                "/authn/credentials",
                 headers={"X-Okapi-Tenant": tenant_id},
                 json={"userId": admin_user_id, "password": admin_user["password"]},
             )
@@ -484,30 +1080,30 @@ class BusyBee:
                 raise Exception(f"could not create login record: {resp.text}")
 
         # check permission record
-        resp = requests.get(
-            f"{self.okapi_url}/perms/users?query=userId%3d%3d{admin_user_id}",
+        resp = self.okapi.get(
+            f"/perms/users?query=userId%3d%3d{admin_user_id}",
             headers={"X-Okapi-Tenant": tenant_id},
         )
         if resp.status_code != 200:
             raise Exception(f"could not get permission record: {resp.text}")
         perm_json = resp.json()
-        top_level_perms = set_tenant_admin_permissions(
-            self.okapi_url, tenant_id, admin_user_id
-        )
+        top_level_perms = self._top_level_permissions(tenant_id)
         if perm_json["totalRecords"] == 0:
             # create permission record
-            resp = requests.post(
-                f"{self.okapi_url}/perms/users",
+            resp = self.okapi.post(
+                "/perms/users",
                 headers={"X-Okapi-Tenant": tenant_id},
                 json={"userId": admin_user_id, "permissions": top_level_perms},
             )
             if resp.status_code != 201:
                 raise Exception(f"could not create permission record: {resp.text}")
+        else:
+            # modules enabled since the admin was created bring new permissions
+            self._grant_missing_permissions(tenant_id, perm_json["permissionUsers"][0], top_level_perms)
 
         # check for service-points-users interface
-        resp = requests.get(
-            f"{self.okapi_url}/_/proxy/tenants/{tenant_id}/interfaces/service-points-users",
-            headers={"X-Okapi-Tenant": "supertenant"},
+        resp = self.okapi.get(
+            f"/_/proxy/tenants/{tenant_id}/interfaces/service-points-users",
         )
         if resp.status_code != 200:
             raise Exception(
@@ -517,8 +1113,8 @@ class BusyBee:
         serv_points_json = resp.json()
         if serv_points_json != []:
             # check for service-points-users record
-            resp = requests.get(
-                f"{self.okapi_url}/service-points-users?query=userId%3d%3d{admin_user_id}",
+            resp = self.okapi.get(
+                f"/service-points-users?query=userId%3d%3d{admin_user_id}",
                 headers={"X-Okapi-Tenant": tenant_id},
             )
             if resp.status_code != 200:
@@ -532,68 +1128,607 @@ class BusyBee:
         # enable authtoken
         set_authtoken_status(True)
 
+    def _top_level_permissions(self, tenant_id):
+        """Returns the names of the permissions of tenant_id that are not part of
+        another permission. They only depend on the enabled modules, so they are
+        computed once per set of enabled module ids."""
+        key = frozenset(self._get_enabled_module_ids(tenant_id))
+        with self.__permissions_lock:
+            if key in self.__top_level_permissions:
+                print("using the top level permissions computed for a tenant with the same modules")
+                return self.__top_level_permissions[key]
+
+        settings = self._config.get("admin-permissions") or {}
+        page_size = settings.get("page-size", 1000)
+        query = (
+            "cql.allRecords=1 not permissionName==perms.users.assign.okapi"
+            " not permissionName==modperms.* not permissionName==SYS#* sortby permissionName"
+        )
+        top_level_perms = []
+        offset = 0
+        while True:
+            resp = self.okapi.get(
+                "/perms/permissions",
+                # mod-permissions pages with length and a 1-based start
+                params={"query": query, "start": offset + 1, "length": page_size},
+                headers={"X-Okapi-Tenant": tenant_id},
+            )
+            if resp.status_code != 200:
+                raise Exception(f"something happened when getting all permissions: {resp.text}")
+            page = resp.json()
+            # a permission is top level when it is only part of system (SYS#) permissions
+            top_level_perms += [
+                permission["permissionName"]
+                for permission in page["permissions"]
+                if all(parent.startswith("SYS#") for parent in permission.get("childOf", []))
+            ]
+            offset += len(page["permissions"])
+            if not page["permissions"] or offset >= page["totalRecords"]:
+                break
+        print(f"found {len(top_level_perms)} top level permissions in {offset} permissions")
+
+        with self.__permissions_lock:
+            self.__top_level_permissions[key] = top_level_perms
+        return top_level_perms
+
+    def _grant_missing_permissions(self, tenant_id, permission_user, permissions):
+        """Adds the permissions the permission user does not have yet, batch-size at a time"""
+        settings = self._config.get("admin-permissions") or {}
+        batch_size = max(1, int(settings.get("batch-size", 500)))
+        granted = set(permission_user.get("permissions", []))
+        missing = [permission for permission in permissions if permission not in granted]
+        if not missing:
+            print(f"tenant admin of tenant({tenant_id}) has all {len(permissions)} top level permissions")
+            return
+
+        print(f"adding {len(missing)} missing permissions to the tenant admin of tenant({tenant_id})")
+        record = dict(permission_user, permissions=list(permission_user.get("permissions", [])))
+        for start in range(0, len(missing), batch_size):
+            record["permissions"] += missing[start:start + batch_size]
+            resp = self.okapi.put(
+                f"/perms/users/{record['id']}",
+                headers={"X-Okapi-Tenant": tenant_id},
+                json=record,
+            )
+            if resp.status_code not in (200, 204):
+                raise Exception(f"could not add permissions to the permission record: {resp.text}")
+
+    def _admin_username(self, tenant_id=None):
+        if tenant_id:
+            return tenant_id + "_admin"
+        return self.admin_user["username"]
+
+    @phase("plan")
+    def snapshot(self, tenant_id: str = None):
+        """Reads the okapi state busybee manages with a few bulk calls"""
+        if not tenant_id:
+            tenant_id = self.tenant["id"]
+
+        reads = [
+            ("env", "/_/env"),
+            ("modules", "/_/proxy/modules"),
+            ("tenants", "/_/proxy/tenants"),
+            ("discovery", "/_/discovery/modules"),
+        ]
+        snapshot = {}
+        for (key, path), resp, error in self._run_concurrently(lambda read: self.okapi.get(read[1]), reads, len(reads)):
+            if error is not None:
+                raise Exception(f"could not read {path}: {error}")
+            if resp.status_code != 200:
+                raise Exception(f"could not read {path}: {resp.text}")
+            snapshot[key] = resp.json()
+
+        snapshot["env"] = {item["name"]: item.get("value") for item in snapshot["env"]}
+        snapshot["modules"] = {module["id"] for module in snapshot["modules"]}
+        snapshot["tenants"] = {tenant["id"] for tenant in snapshot["tenants"]}
+        snapshot["tenant_modules"] = set()
+        if tenant_id in snapshot["tenants"]:
+            snapshot["tenant_modules"] = self._get_enabled_module_ids(tenant_id)
+        snapshot["admin"] = self._admin_snapshot(tenant_id, snapshot["tenant_modules"])
+        return snapshot
+
+    def _admin_snapshot(self, tenant_id, tenant_modules):
+        admin = {"username": self._admin_username(tenant_id), "complete": False}
+        if not tenant_modules:
+            return admin
+
+        headers = {"X-Okapi-Tenant": tenant_id}
+        resp = self.okapi.get(f"/users?query=username%3d%3d{admin['username']}", headers=headers)
+        if resp.status_code != 200:
+            # records can't be read once authtoken is enabled, and busybee
+            # only enables it after the admin user has been set up
+            admin["complete"] = any(module_id.startswith("mod-authtoken-") for module_id in tenant_modules)
+            return admin
+        users = resp.json()["users"]
+        if not users:
+            return admin
+
+        user_id = users[0]["id"]
+        cred_resp = self.okapi.get(f"/authn/credentials-existence?userId={user_id}", headers=headers)
+        perm_resp = self.okapi.get(f"/perms/users?query=userId%3d%3d{user_id}", headers=headers)
+        admin["complete"] = (
+            cred_resp.status_code == 200
+            and cred_resp.json()["credentialsExist"]
+            and perm_resp.status_code == 200
+            and perm_resp.json()["totalRecords"] > 0
+        )
+        return admin
+
+    def plan(self, tenant_id: str = None):
+        """Compares config.yml and the descriptor cache with a snapshot of okapi"""
+        if not tenant_id:
+            tenant_id = self.tenant["id"]
+        snapshot = self.snapshot(tenant_id)
+        plan = Plan(tenant_id, snapshot)
+
+        env_vars = self._desired_env_vars()
+        plan.env_set = [name for name, value in env_vars.items() if snapshot["env"].get(name) != value]
+        plan.env_remove = [name for name in snapshot["env"] if name not in env_vars]
+        plan.register = [
+            module.id for module in self._mod_descriptors.values() if module.id not in snapshot["modules"]
+        ]
+        plan.create_tenant = tenant_id not in snapshot["tenants"]
+
+        be_modules = self._config["be-modules"]
+        ui_modules = self._config["ui-modules"]
+        plan.enable = [
+            self._mod_descriptors[item].id
+            for item in be_modules + ui_modules
+            if self._mod_descriptors[item].id not in snapshot["tenant_modules"]
+        ]
+        deployed_ids = {instance["srvcId"] for instance in snapshot["discovery"]}
+        plan.deploy = [
+            item
+            for item in be_modules
+            if self._mod_descriptors[item].id in snapshot["tenant_modules"]
+            and self._mod_descriptors[item].id not in deployed_ids
+            and self._mod_descriptors[item].launch_descriptor is not None
+        ]
+        plan.create_admin = not snapshot["admin"]["complete"]
+        return plan
+
+    def apply(self, tenant_id: str = None):
+        """Executes only the actions of the current plan. Returns the plan, or
+        False when the tenant could not be created"""
+        if not tenant_id:
+            tenant_id = self.tenant["id"]
+        plan = self.plan(tenant_id)
+        for line in plan.describe():
+            self.term_messages.send(line)
+        if plan.empty:
+            return plan
+        snapshot = plan.snapshot
+
+        def run_steps(steps):
+            # steps of one stage don't depend on each other
+            errors = [error for _, _, error in self._run_concurrently(lambda step: step(), steps, len(steps) or 1)]
+            errors = [error for error in errors if error is not None]
+            if errors:
+                raise errors[0]
+
+        steps = []
+        if plan.env_set or plan.env_remove:
+            steps.append(lambda: self.set_module_env_vars(current_env=snapshot["env"]))
+        if plan.register:
+            steps.append(lambda: self.register_modules(registered_ids=snapshot["modules"]))
+        run_steps(steps)
+
+        if plan.create_tenant:
+            created = self.create_tenant() if tenant_id == self.tenant["id"] else self.create_tenant(tenant_id)
+            if not created:
+                # the next steps all need the tenant
+                self.error_msg.send(f"apply stopped, tenant({tenant_id}) could not be created")
+                return False
+
+        steps = []
+        if plan.enable:
+            enabled_ids = None if plan.create_tenant else snapshot["tenant_modules"]
+            steps.append(lambda: self.enable_modules_for_tenant(tenant_id, enabled_ids=enabled_ids))
+        if plan.deploy:
+            steps.append(lambda: self.deploy_modules(plan.deploy))
+        run_steps(steps)
+
+        if plan.create_admin:
+            self.create_tenant_admin(tenant_id)
+        return plan
+
+    @phase("upgrade")
+    def upgrade_modules(self, module_names=None):
+        """Upgrades the modules (all configured modules by default) running in okapi
+        with another id than install.json: registers the new descriptors, deploys
+        and waits for the new instances, upgrades every tenant with one install call
+        and only then removes the old instances. Returns the names that failed."""
+        print("###############")
+        print("UPGRADING MODULES")
+        print("###############")
+        cached_ids = {module_name: module.id for module_name, module in self._mod_descriptors.items()}
+        self.reload()
+        module_names = self._available_modules(module_names or list(self._mod_descriptors))
+
+        instances, tenant_modules = self._running_modules()
+        running_ids = {}
+        for module_id in [instance["srvcId"] for instance in instances] + [
+            module_id for module_ids in tenant_modules.values() for module_id in module_ids
+        ]:
+            running_ids.setdefault(self._module_name(module_id), set()).add(module_id)
+
+        # the cache may have been reloaded already, so what okapi runs counts as well
+        upgrades = {}
+        for module_name in module_names:
+            new_id = self._mod_descriptors[module_name].id
+            old_ids = (running_ids.get(module_name, set()) | {cached_ids.get(module_name)}) - {new_id, None}
+            if old_ids:
+                upgrades[module_name] = old_ids
+                print(f"{module_name}: {', '.join(sorted(old_ids))} -> {new_id}")
+        if not upgrades:
+            print("all modules are up to date")
+            return []
+
+        self.register_modules(module_names=list(upgrades))
+        return self._replace_instances(upgrades, instances, tenant_modules)
+
+    @phase("deploy")
+    def redeploy_modules(self, module_names):
+        """Replaces the instances of modules with new ones, removing the old
+        instances once the new ones are ready. Returns the names that failed."""
+        module_names = self._available_modules(module_names)
+        instances, _ = self._running_modules()
+        return self._replace_instances({module_name: {self._mod_descriptors[module_name].id} for module_name in module_names}, instances, {})
+
+    def _available_modules(self, module_names):
+        for module_name in module_names:
+            if module_name not in self._mod_descriptors:
+                self.error_msg.send(f"module {module_name} is not available.")
+        return [module_name for module_name in module_names if module_name in self._mod_descriptors]
+
+    def _running_modules(self):
+        """Returns the deployed instances (without redirects) and the ids of the
+        modules enabled for every tenant"""
+        resp = self.okapi.get("/_/discovery/modules")
+        resp.raise_for_status()  # Raise an exception for HTTP errors
+        redirect_prefix = self.instIdTemplate.format("")
+        instances = [instance for instance in resp.json() if not instance["instId"].startswith(redirect_prefix)]
+
+        resp = self.okapi.get("/_/proxy/tenants")
+        resp.raise_for_status()  # Raise an exception for HTTP errors
+        tenant_ids = [tenant["id"] for tenant in resp.json() if tenant["id"] != "supertenant"]
+        tenant_modules = {}
+        for tenant_id, module_ids, error in self._run_concurrently(
+            self._get_enabled_module_ids, tenant_ids, self._config.get("okapi-workers", 4)
+        ):
+            if error is not None:
+                raise Exception(f"could not get the modules of tenant({tenant_id}): {error}")
+            tenant_modules[tenant_id] = module_ids
+        return instances, tenant_modules
+
+    def _replace_instances(self, old_ids, instances, tenant_modules):
+        """Deploys a new instance of every module of old_ids (name -> ids to replace)
+        that has instances of those ids, enables the new ids in the tenants which
+        have old ids enabled, then removes the old instances. A healthy instance of
+        the new id left by an earlier attempt is used instead of deploying another.
+        Modules whose new instance or tenant upgrade failed get their new instances
+        removed and keep their old ones."""
+        workers = self._config.get("okapi-workers", 4)
+        old_instances = {
+            module_name: [instance for instance in instances if instance["srvcId"] in ids]
+            for module_name, ids in old_ids.items()
+        }
+        new_ids = {module_name: self._mod_descriptors[module_name].id for module_name in old_ids}
+
+        # instances of the new id that were running before, e.g. after a failed upgrade
+        leftovers = [
+            (module_name, instance)
+            for module_name, found in old_instances.items()
+            if found and new_ids[module_name] not in old_ids[module_name]
+            for instance in instances
+            if instance["srvcId"] == new_ids[module_name]
+        ]
+        reused = set()
+        stale = []
+        for (module_name, instance), health, error in self._run_concurrently(
+            lambda leftover: self._instance_health(leftover[1]), leftovers, workers
+        ):
+            if error is None and health["healthStatus"] and module_name not in reused:
+                reused.add(module_name)
+                print(f"using the running instance {instance['instId']} of {instance['srvcId']}")
+            else:
+                stale.append((module_name, instance))
+
+        failed = set(
+            self.deploy_modules(
+                [module_name for module_name, found in old_instances.items() if found and module_name not in reused]
+            )
+        )
+
+        # one install call per tenant, with the modules in dependency order
+        ordered = [module_name for module_name in old_ids if module_name not in failed]
+        try:
+            # the other modules are enabled already
+            levels, _ = self._dependency_levels(ordered, report_missing=False)
+            ordered = [module_name for level in levels for module_name in level]
+        except DependencyCycleException:
+            pass
+        installs = []
+        for tenant_id, module_ids in tenant_modules.items():
+            upgraded = [module_name for module_name in ordered if old_ids[module_name] & module_ids]
+            if upgraded:
+                installs.append((tenant_id, upgraded))
+
+        params = dict(self._be_install_params(TENANT_DATA_PARAMETERS["reference"]), deploy="false", depCheck="false")
+
+        def upgrade_tenant(install):
+            tenant_id, upgraded = install
+            module_ids = [new_ids[module_name] for module_name in upgraded]
+            print(f"upgrading modules({', '.join(module_ids)}) for tenant({tenant_id})")
+            error = self._install(tenant_id, module_ids, params)
+            if error is not None:
+                raise Exception(f"could not upgrade modules for tenant({tenant_id}): {error}")
+            print(f"upgraded {len(module_ids)} modules for tenant({tenant_id})")
+
+        # modules enabled with their new id in at least one tenant
+        upgraded = set()
+        results = self._run_concurrently(upgrade_tenant, installs, self._config.get("tenant-workers", 4))
+        for (tenant_id, modules), _, error in results:
+            if error is not None:
+                failed.update(modules)
+                self.error_msg.send(str(error))
+            else:
+                upgraded.update(modules)
+
+        redirect_prefix = self.instIdTemplate.format("")
+
+        def new_instances(module_name):
+            resp = self.okapi.get(f"/_/discovery/modules/{new_ids[module_name]}")
+            if resp.status_code == 404:
+                return []
+            resp.raise_for_status()  # Raise an exception for HTTP errors
+            old_inst_ids = {instance["instId"] for instance in old_instances[module_name]}
+            return [
+                instance
+                for instance in resp.json()
+                if instance["instId"] not in old_inst_ids and not instance["instId"].startswith(redirect_prefix)
+            ]
+
+        # failed modules go back to their old instances, unless a tenant already uses the new ones
+        for module_name in sorted(failed & upgraded):
+            self.error_msg.send(f"keeping the new instances of {module_name}, some tenants were upgraded to {new_ids[module_name]}")
+        rollback = []
+        for module_name, found, error in self._run_concurrently(
+            new_instances,
+            [module_name for module_name in old_ids if module_name in failed - upgraded and old_instances[module_name]],
+            workers,
+        ):
+            if error is not None:
+                self.error_msg.send(f"could not get the new instances of {module_name}: {error}")
+            else:
+                rollback += found
+
+        def remove_instance(instance):
+            resp = self.okapi.delete(f"/_/discovery/modules/{instance['srvcId']}/{instance['instId']}")
+            if resp.status_code != 204 and resp.status_code != 404:
+                raise Exception(f"could not remove instance {instance['instId']} of {instance['srvcId']}: {resp.text}")
+
+        replaced_instances = [
+            instance
+            for module_name, found in old_instances.items()
+            if module_name not in failed
+            for instance in found
+        ]
+        to_remove = replaced_instances + [instance for module_name, instance in stale if module_name not in failed]
+        removed = set()
+        for instance, _, error in self._run_concurrently(remove_instance, to_remove + rollback, workers):
+            module_name = self._module_name(instance["srvcId"])
+            if error is not None:
+                failed.add(module_name)
+                self.error_msg.send(str(error))
+            elif instance in replaced_instances:
+                removed.add(module_name)
+
+        replaced = [module_name for module_name in old_ids if module_name not in failed and (module_name in removed or module_name in upgraded)]
+        unchanged = [module_name for module_name in old_ids if module_name not in failed and module_name not in replaced]
+        if replaced:
+            self.term_messages.send(f"replaced {', '.join(replaced)}")
+        if unchanged:
+            self.term_messages.send(f"nothing to replace for {', '.join(unchanged)}")
+        return [module_name for module_name in old_ids if module_name in failed]
+
+    @phase("deploy")
     def undeploy_module(self, module_name):
         if module_name in self._mod_descriptors.keys():
             module = self._mod_descriptors[module_name]
             self.term_messages.send(f"undeploying module {module_name}")
-            del_resp = requests.delete(
-                f"{self.okapi_url}/_/discovery/modules/{module['id']}",
+            del_resp = self.okapi.delete(
+                f"/_/discovery/modules/{module.id}",
                 headers={
-                    "X-Okapi-Tenant": "supertenant",
                     "Content-type": "application/json",
                     "Accept": "text/plain",
                 },
             )
             if del_resp.status_code != 204:
                 self.error_msg.send(f"module could not be undeployed: {del_resp.text}")
-                return
+                return False
             self.term_messages.send(
                 f"all module deployments & redirects of {module_name} was removed!"
             )
+            return True
         else:
             self.error_msg.send(
                 f"module {module_name} is not available. check config and logs."
             )
+            return False
 
+    @phase("deploy")
     def deploy_module(self, module_name):
-        if module_name in self._mod_descriptors.keys():
-            module = self._mod_descriptors[module_name]
-            node_resp = requests.get(f"{self.okapi_url}/_/discovery/nodes")
-            if node_resp.status_code != 200:
-                self.error_msg.send(f"Could not deploy {module_name}: {node_resp.text}")
-                return
-            nodes = node_resp.json()
-            if len(nodes) == 0:
-                self.error_msg.send(f"there are no nodes available")
-                return
+        return self.deploy_modules([module_name])
 
-            # TODO could have the user select which node to use
-            node = nodes[0]
+    @phase("deploy")
+    def deploy_modules(self, module_names):
+        """Deploys an instance of every module at the same time, on the discovery
+        nodes picked by the scheduler. Returns the names that could not be deployed."""
+        unavailable = [module_name for module_name in module_names if module_name not in self._mod_descriptors]
+        for module_name in unavailable:
+            self.error_msg.send(f"module {module_name} is not available.")
+        module_names = [module_name for module_name in module_names if module_name in self._mod_descriptors]
+        if not module_names:
+            return unavailable
 
-            self.term_messages.send(f"deploying module {module_name}")
-            post_resp = requests.post(
-                f"{self.okapi_url}/_/discovery/modules",
+        try:
+            scheduler = self._scheduler()
+        except Exception as e:
+            self.error_msg.send(f"Could not deploy {', '.join(module_names)}: {e}")
+            return unavailable + module_names
+
+        # place every instance first, so the load of each node accounts for all of them
+        placements = []
+        failed = list(unavailable)
+        for module_name in module_names:
+            try:
+                node_id = scheduler.place(module_name, self._module_memory(module_name))
+            except SchedulingException as e:
+                failed.append(module_name)
+                self.error_msg.send(f"Could not deploy {module_name}: {e}")
+                continue
+            placements.append((module_name, node_id))
+
+        def deploy(placement):
+            module_name, node_id = placement
+            self.term_messages.send(f"deploying module {module_name} on node {node_id}")
+            post_resp = self.okapi.post(
+                "/_/discovery/modules",
                 headers={
-                    "X-Okapi-Tenant": "supertenant",
                     "Content-type": "application/json",
                     "Accept": "text/plain",
                 },
-                json={"srvcId": module["id"], "nodeId": node["nodeId"]},
+                json={"srvcId": self._mod_descriptors[module_name].id, "nodeId": node_id},
             )
             if post_resp.status_code != 201:
-                self.error_msg.send(f"module could not be deployed: {post_resp.text}")
-                return
-            self.term_messages.send("module is deployed!")
-        else:
-            self.error_msg.send(f"module {module_name} is not available.")
+                raise Exception(f"module {module_name} could not be deployed: {post_resp.text}")
+            self.term_messages.send(f"module {module_name} is deployed!")
+            return post_resp.json()
+
+        deployed = {}
+        for (module_name, _), instance, error in self._run_concurrently(deploy, placements, self._config.get("okapi-workers", 4)):
+            if error is not None:
+                failed.append(module_name)
+                self.error_msg.send(str(error))
+            else:
+                deployed[module_name] = instance
+
+        not_ready = self.wait_until_ready(list(deployed.values()))
+        for module_name, instance in deployed.items():
+            if instance in not_ready:
+                failed.append(module_name)
+        return failed
+
+    def wait_until_ready(self, instances, timeout=None):
+        """Polls the okapi health of all instances (discovery entries with srvcId
+        and instId) at once, backing off between rounds, until every instance is
+        healthy or timeout (readiness.timeout by default) runs out. A timeout of 0
+        checks once. Returns the instances not ready."""
+        settings = self._config.get("readiness") or {}
+        if not instances or not settings.get("enabled", True):
+            return []
+        interval = settings.get("poll-interval", 0.5)
+        max_interval = settings.get("poll-max-interval", 5)
+        start = time.monotonic()
+        deadline = start + (settings.get("timeout", 300) if timeout is None else timeout)
+
+        pending = list(instances)
+        print(f"waiting for {len(pending)} instances to be ready")
+        while True:
+            still_pending = []
+            for instance, health, error in self._run_concurrently(self._instance_health, pending, len(pending)):
+                if error is None and health["healthStatus"]:
+                    print(f"{instance['srvcId']} ({instance['instId']}) is ready after {time.monotonic() - start:.1f}s")
+                else:
+                    still_pending.append((instance, str(error) if error is not None else health["healthMessage"]))
+            if not still_pending:
+                return []
+            if time.monotonic() >= deadline:
+                for instance, message in still_pending:
+                    self.error_msg.send(f"{instance['srvcId']} ({instance['instId']}) is not ready: {message}")
+                return [instance for instance, _ in still_pending]
+            pending = [instance for instance, _ in still_pending]
+            cancellable_sleep(min(interval, max(0, deadline - time.monotonic())))
+            interval = min(interval * 2, max_interval)
+
+    def _instance_health(self, instance):
+        """Returns the okapi health descriptor of an instance with the seconds the check took"""
+        start = time.perf_counter()
+        resp = self.okapi.get(f"/_/discovery/health/{instance['srvcId']}/{instance['instId']}")
+        seconds = time.perf_counter() - start
+        if resp.status_code != 200:
+            return {"healthStatus": False, "healthMessage": resp.text, "seconds": seconds}
+        health = resp.json()
+        if isinstance(health, list):
+            health = health[0]
+        return dict(health, seconds=seconds)
+
+    @phase("health")
+    def health(self):
+        """Checks every deployed instance and redirect at the same time. Returns
+        their discovery entries with healthStatus, healthMessage and seconds."""
+        resp = self.okapi.get("/_/discovery/modules")
+        resp.raise_for_status()  # Raise an exception for HTTP errors
+        instances = resp.json()
+        report = []
+        for instance, health, error in self._run_concurrently(self._instance_health, instances, self._config.get("okapi-workers", 4)):
+            if error is not None:
+                health = {"healthStatus": False, "healthMessage": str(error), "seconds": None}
+            report.append(dict(instance, healthStatus=health["healthStatus"], healthMessage=health["healthMessage"], seconds=health["seconds"]))
+        return sorted(report, key=lambda instance: (instance["srvcId"], instance["instId"]))
+
+    def _module_memory(self, module_name):
+        """Returns the container memory of a module as registered by busybee"""
+        module = self._mod_descriptors[module_name]
+        if module.launch_descriptor is None:
+            return 0
+        return module_resources(self._config, module_name)["memory"] or descriptor_memory(module.launch_descriptor)
 
+    def resource_plan(self):
+        """Returns the module_resources of every module with a launchDescriptor"""
+        return {
+            module_name: module_resources(self._config, module_name)
+            for module_name, module in self._mod_descriptors.items()
+            if module.launch_descriptor is not None
+        }
+
+    def _scheduler(self):
+        """Builds a scheduler from the discovery nodes, the instances running on
+        them and the deploy section of config.yml"""
+        settings = self._config.get("deploy") or {}
+        node_resp = self.okapi.get("/_/discovery/nodes")
+        if node_resp.status_code != 200:
+            raise Exception(node_resp.text)
+        instances_resp = self.okapi.get("/_/discovery/modules")
+        if instances_resp.status_code != 200:
+            raise Exception(instances_resp.text)
+
+        memory_by_id = {module.id: self._module_memory(module_name) for module_name, module in self._mod_descriptors.items()}
+        default_memory = parse_memory(settings.get("default-memory", "1g"))
+
+        node_memory = settings.get("node-memory") or {}
+        if not isinstance(node_memory, dict):
+            node_memory = {"default": node_memory}
+        # redirects don't run on a node
+        redirect_prefix = self.instIdTemplate.format("")
+        instances = [instance for instance in instances_resp.json() if not instance["instId"].startswith(redirect_prefix)]
+        return Scheduler(
+            [node["nodeId"] for node in node_resp.json()],
+            instances,
+            lambda module_id: memory_by_id.get(module_id, default_memory),
+            strategy=settings.get("strategy", "least-loaded"),
+            capacity=node_memory,
+            pins=settings.get("pin"),
+        )
+
+    @phase("redirect")
     def remove_redirect(self, module_name):
         if module_name in self._mod_descriptors.keys():
             module = self._mod_descriptors[module_name]
-            del_resp = requests.delete(
-                f"{self.okapi_url}/_/discovery/modules/{module['id']}/{self.instIdTemplate.format(module_name)}",
+            del_resp = self.okapi.delete(
+                f"/_/discovery/modules/{module.id}/{self.instIdTemplate.format(module_name)}",
                 headers={
-                    "X-Okapi-Tenant": "supertenant",
                     "Content-type": "application/json",
                     "Accept": "text/plain",
                 },
@@ -602,28 +1737,36 @@ class BusyBee:
                 self.error_msg.send(
                     f"module redirect could not be removed: {del_resp.text}"
                 )
-                return
+                return False
             self.term_messages.send("module redirect has removed!")
-            return
+            return True
         else:
             self.error_msg.send(f"module {module_name} is not available.")
+            return False
 
+    @phase("redirect")
     def add_redirect(self, module_name, http_location):
         if module_name in self._mod_descriptors.keys():
             module = self._mod_descriptors[module_name]
             self.term_messages.send(f"redirecting {module_name} to {http_location}")
-            post_resp = requests.post(
-                f"{self.okapi_url}/_/discovery/modules",
+            post_resp = self.okapi.post(
+                "/_/discovery/modules",
                 headers={
-                    "X-Okapi-Tenant": "supertenant",
                     "Content-type": "application/json",
                     "Accept": "text/plain",
                 },
-                json={"srvcId": module["id"], "instId": self.instIdTemplate.format(module_name), "url": http_location},
+                json={"srvcId": module.id, "instId": self.instIdTemplate.format(module_name), "url": http_location},
             )
             if post_resp.status_code != 201:
                 self.error_msg.send(f"module could not be redirected: {post_resp.text}")
-                return
+                return False
+            # redirects usually point to a module the developer starts later, so don't wait long for it
+            redirect_timeout = (self._config.get("readiness") or {}).get("redirect-timeout", 0)
+            if self.wait_until_ready([post_resp.json()], timeout=redirect_timeout):
+                self.term_messages.send(f"module has been redirected, but {http_location} does not answer yet")
+                return True
             self.term_messages.send("module has been redirected!")
+            return True
         else:
             self.error_msg.send(f"module {module_name} is not available.")
+            return False
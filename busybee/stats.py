@@ -0,0 +1,175 @@
+import contextvars
+import functools
+import json
+import math
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+current_phase = contextvars.ContextVar("busybee_phase", default="other")
+
+MODULE_ID_PATTERN = re.compile(r"^[\w-]+-\d+\.\d+[\w.+-]*$")
+UUID_PATTERN = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+
+
+def phase(name):
+    """Decorator tagging every HTTP call made while the function runs with a phase name"""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = current_phase.set(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                current_phase.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+def endpoint_template(path):
+    """Replaces the ids in an okapi path with placeholders, e.g.
+    /_/proxy/tenants/diku/modules/mod-users-19.3.0 -> /_/proxy/tenants/{tenant}/modules/{module}"""
+    segments = urlparse(path).path.split("/")
+    template = []
+    for index, segment in enumerate(segments):
+        previous = segments[index - 1] if index > 0 else ""
+        if previous == "tenants":
+            template.append("{tenant}")
+        elif previous == "env" and segment:
+            template.append("{name}")
+        elif previous == "install" and segment:
+            template.append("{job}")
+        elif previous == "interfaces":
+            template.append("{interface}")
+        elif MODULE_ID_PATTERN.match(segment):
+            template.append("{module}")
+        elif UUID_PATTERN.match(segment) or segment.startswith("busybee-redirect::"):
+            template.append("{id}")
+        else:
+            template.append(segment)
+    return "/".join(template)
+
+
+def module_of(path, payload):
+    """Returns the module id a call is about, if there is a single one"""
+    for segment in urlparse(path).path.split("/"):
+        if MODULE_ID_PATTERN.match(segment):
+            return segment
+    if isinstance(payload, list) and len(payload) == 1:
+        payload = payload[0]
+    if isinstance(payload, dict):
+        module_id = payload.get("srvcId") or payload.get("id")
+        if isinstance(module_id, str) and MODULE_ID_PATTERN.match(module_id):
+            return module_id
+    return None
+
+
+def percentile(sorted_values, fraction):
+    # nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class RequestStats:
+    """Ring buffer holding the most recent timed HTTP calls"""
+
+    def __init__(self, size=10000):
+        self.records = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, method, path, status, seconds, payload=None):
+        record = {
+            "time": time.time(),
+            "phase": current_phase.get(),
+            "method": method,
+            "endpoint": endpoint_template(path),
+            "module": module_of(path, payload),
+            "status": status,
+            "seconds": round(seconds, 6),
+        }
+        with self.lock:
+            self.records.append(record)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.records)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def endpoint_summary(self):
+        """Returns count, error count, p50, p95 and max seconds per phase, method and endpoint"""
+        groups = {}
+        for record in self.snapshot():
+            key = (record["phase"], record["method"], record["endpoint"])
+            groups.setdefault(key, []).append(record)
+
+        summary = []
+        for (phase_name, method, endpoint), records in groups.items():
+            durations = sorted(record["seconds"] for record in records)
+            summary.append(
+                {
+                    "phase": phase_name,
+                    "method": method,
+                    "endpoint": endpoint,
+                    "count": len(records),
+                    "errors": sum(1 for record in records if record["status"] == "error" or record["status"] >= 400),
+                    "total": sum(durations),
+                    "p50": percentile(durations, 0.50),
+                    "p95": percentile(durations, 0.95),
+                    "max": durations[-1],
+                }
+            )
+        return sorted(summary, key=lambda item: item["total"], reverse=True)
+
+    def slowest_modules(self, limit=10):
+        """Returns the modules whose calls took the most time in total"""
+        modules = {}
+        for record in self.snapshot():
+            if record["module"] is None:
+                continue
+            entry = modules.setdefault(record["module"], {"module": record["module"], "count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += record["seconds"]
+            entry["max"] = max(entry["max"], record["seconds"])
+        return sorted(modules.values(), key=lambda item: item["total"], reverse=True)[:limit]
+
+    def to_json_lines(self):
+        return "".join(json.dumps(record) + "\n" for record in self.snapshot())
+
+    def to_prometheus(self):
+        def labels(**values):
+            escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"') for key, value in values.items()}
+            return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+        lines = [
+            "# HELP busybee_http_request_duration_seconds Duration of the HTTP calls made by busybee.",
+            "# TYPE busybee_http_request_duration_seconds summary",
+        ]
+        for item in self.endpoint_summary():
+            common = dict(phase=item["phase"], method=item["method"], endpoint=item["endpoint"])
+            for quantile in ("0.5", "0.95"):
+                value = item["p50"] if quantile == "0.5" else item["p95"]
+                lines.append(f"busybee_http_request_duration_seconds{labels(**common, quantile=quantile)} {value}")
+            lines.append(f"busybee_http_request_duration_seconds_sum{labels(**common)} {item['total']}")
+            lines.append(f"busybee_http_request_duration_seconds_count{labels(**common)} {item['count']}")
+
+        statuses = {}
+        for record in self.snapshot():
+            key = (record["phase"], record["method"], record["endpoint"], record["status"])
+            statuses[key] = statuses.get(key, 0) + 1
+        lines.append("# HELP busybee_http_requests_total HTTP calls made by busybee by status code.")
+        lines.append("# TYPE busybee_http_requests_total counter")
+        for (phase_name, method, endpoint, status), count in sorted(statuses.items(), key=str):
+            lines.append(
+                f"busybee_http_requests_total{labels(phase=phase_name, method=method, endpoint=endpoint, status=status)} {count}"
+            )
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,62 @@
+import os
+import shutil
+
+import pytest
+
+from busybee.cache import CacheException, DescriptorCache
+
+MODULES = {
+    f"mod-{name}": {"id": f"mod-{name}-1.0.0", "desc": {"id": f"mod-{name}-1.0.0", "provides": [{"id": name}]}}
+    for name in ("users", "login", "inventory")
+}
+
+
+def descriptors(records):
+    return {name: record.descriptor() for name, record in records.items()}
+
+
+def expected():
+    return {name: module["desc"] for name, module in MODULES.items()}
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / ".descriptor-cache")
+
+
+def test_save_after_the_cache_was_removed(cache_dir):
+    cache = DescriptorCache(cache_dir)
+    cache.save(MODULES)
+    shutil.rmtree(cache_dir)
+
+    # the index loaded before the removal must not be reused
+    assert descriptors(cache.save(MODULES)) == expected()
+    assert descriptors(DescriptorCache(cache_dir).load()) == expected()
+
+
+def test_save_after_the_pack_was_cut_short(cache_dir):
+    cache = DescriptorCache(cache_dir)
+    cache.save(MODULES)
+    pack_path = cache.pack_path(cache.load_index()["generation"])
+    with open(pack_path, "r+b") as pack_file:
+        pack_file.truncate(os.path.getsize(pack_path) // 2)
+
+    assert descriptors(cache.save(MODULES)) == expected()
+    assert descriptors(DescriptorCache(cache_dir).load()) == expected()
+
+
+def test_damaged_cache_is_found_and_cleared(cache_dir):
+    cache = DescriptorCache(cache_dir)
+    cache.save(MODULES)
+    pack_path = cache.pack_path(cache.load_index()["generation"])
+    with open(pack_path, "r+b") as pack_file:
+        pack_file.write(b"\0" * os.path.getsize(pack_path))
+
+    assert not cache.verify()
+    with pytest.raises(CacheException):
+        cache.load()["mod-users"].descriptor()
+
+    cache.clear()
+    assert not cache.exists()
+    assert descriptors(cache.save(MODULES)) == expected()
+    assert cache.verify()